@@ -1,7 +1,9 @@
-import viavi
-import time
+import pool
+from recorder import Recorder
+from sampler import Sampler
 
-a=viavi.Mpa2100()
+# Reconnects and re-selects the application if the telnet session drops during the soak
+a=pool.ManagedMpa2100()
 a.connect('10.10.40.197')
 a.show_running_applications()
 
@@ -12,17 +14,33 @@ a.remote_session_start()
 
 data_file=open("data.txt", "w")
 
-data_file.write("Rx_power" + "," + "time_elapsed" + "," + "err seconds")
+data_file.write("Rx_power" + "," + "time_elapsed" + "," + "err seconds" + "\n")
+# Same samples in the columnar binary format, with the host timestamp
+record_file = Recorder(
+    "data.rec",
+    [("host_time", "f8"), ("rx_power", "f8"), ("time_elapsed", "f8"), ("err_seconds", "f8"), ("missed", "u4")],
+    chunk_rows=64,
+    mode="w",  # a new log per run, like data.txt
+)
 time_seconds = a.test_time()
 
 print(type(a.error_present()))
 
-while int(a.error_present()) < 2:
-    data_file.write(a.read_Rx_power() + ",")
-    data_file.write(a.test_time() + ",")
-    data_file.write(a.error_present() + "\n")
-    print(a.test_time() + "  ,  " + a.read_Rx_power())
-    time.sleep(5)
-
-
-data_file.close()
\ No newline at end of file
+# Rx power, elapsed time and error seconds in one round trip per sample, every 5 s without drift
+sampler = Sampler(lambda: dict(zip(("rx_power", "time_elapsed", "err_seconds"), a.read_soak_sample())), period=5)
+previous_duration = None
+for sample in sampler.samples():
+    rx_power, time_elapsed, err_seconds = sample["values"].values()
+    if err_seconds is not None and err_seconds >= 2:
+        break
+    data_file.write(f"{rx_power},{time_elapsed},{err_seconds}\n")
+    record_file.append((sample["host_time"], rx_power, time_elapsed, err_seconds, sample["missed"]))
+    print(f"{time_elapsed}  ,  {rx_power}")
+    if sample["missed"]:
+        # The deadlines were missed while the previous sample was being read
+        print(f"Missed {sample['missed']} sample deadline(s), previous query took {previous_duration:.1f}s")
+    previous_duration = sample["duration"]
+
+
+data_file.close()
+record_file.close()
\ No newline at end of file
@@ -0,0 +1,347 @@
+"""
+========================================================================================================================
+# Information
+Single pass analysis of soak logs, the CSV logs (e.g. data.txt) and the recorder files (recorder.py), read in chunks
+so the memory does not grow with the file:
+    - rx power over a sliding window of samples, every step samples: min, max, mean and percentiles, and over the
+      whole log (percentiles from a fixed bin histogram)
+    - error second onsets: samples where the error seconds counter increases
+    - drop outs: gaps between samples longer than gap_factor sample periods, and test restarts (time going back)
+    - min/max decimated rx power series for plots, at most 2 * points buckets
+
+The windows are passed on as they complete (on_window, e.g. written to a JSON lines file) instead of being kept, and
+at most max_events error onsets, drop outs and restarts each are kept (all are counted), so the memory stays flat
+however long the log is.
+
+    python analysis.py data.txt --window 720 --step 60 --points 2000 --output summary.json --windows windows.jsonl
+
+    summary = analyze("soak.rec", on_window=windows.append)
+    plt.fill_between(summary["decimated"]["time"], summary["decimated"]["min"], summary["decimated"]["max"])
+========================================================================================================================
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+from recorder import MAGIC, RecordFile, csv_chunks
+
+
+def chunks(path, chunk_rows=65536):
+    """return: generator of dicts name -> array, for a recorder file or a CSV log"""
+    with open(path, "rb") as file:
+        is_record = file.read(len(MAGIC)) == MAGIC
+    if not is_record:
+        yield from csv_chunks(path, chunk_rows)
+        return
+    with RecordFile(path) as record:
+        # Copies, the chunks are views of the memory map closed after the last one
+        yield from ({name: np.array(values) for name, values in chunk.items()} for chunk in record.chunks())
+
+
+def _column(chunk, name):
+    """return: column of a chunk by name, case insensitive (e.g. "Rx_power" for "rx_power"), None if missing"""
+    for key, values in chunk.items():
+        if key.lower() == name.lower():
+            return np.asarray(values, dtype=np.float64)
+    return None
+
+
+class MinMaxDecimator:
+    """Min/max per bucket of consecutive samples; the bucket size doubles when there are more than 2 * points"""
+
+    def __init__(self, points=2000):
+        self.points = points
+        self.bucket_rows = 1
+        self.time = np.empty(0)
+        self.min = np.empty(0)
+        self.max = np.empty(0)
+        # Samples of the bucket in progress
+        self.carry_time = np.empty(0)
+        self.carry_value = np.empty(0)
+
+    def feed(self, time, value):
+        time = np.concatenate([self.carry_time, time])
+        value = np.concatenate([self.carry_value, value])
+        full = len(value) // self.bucket_rows * self.bucket_rows
+        self.carry_time, self.carry_value = time[full:], value[full:]
+        if full:
+            buckets = value[:full].reshape(-1, self.bucket_rows)
+            with np.errstate(invalid="ignore"):
+                self.time = np.concatenate([self.time, time[:full : self.bucket_rows]])
+                self.min = np.concatenate([self.min, np.fmin.reduce(buckets, axis=1)])
+                self.max = np.concatenate([self.max, np.fmax.reduce(buckets, axis=1)])
+        while len(self.min) > 2 * self.points:
+            self._merge()
+
+    def _merge(self):
+        """Merge pairs of buckets, an odd last bucket goes back to the samples in progress as its bounds"""
+        pairs = len(self.min) // 2 * 2
+        if pairs < len(self.min):
+            self.carry_time = np.concatenate([self.time[-1:].repeat(2), self.carry_time])
+            self.carry_value = np.concatenate([[self.min[-1], self.max[-1]], self.carry_value])
+        self.time = self.time[:pairs:2]
+        self.min = np.fmin(self.min[:pairs:2], self.min[1:pairs:2])
+        self.max = np.fmax(self.max[:pairs:2], self.max[1:pairs:2])
+        self.bucket_rows *= 2
+
+    def result(self):
+        """return: dict time, min, max as lists, the bucket in progress included"""
+        time, low, high = self.time, self.min, self.max
+        if len(self.carry_value):
+            time = np.append(time, self.carry_time[0])
+            low = np.append(low, np.nanmin(self.carry_value) if np.isfinite(self.carry_value).any() else np.nan)
+            high = np.append(high, np.nanmax(self.carry_value) if np.isfinite(self.carry_value).any() else np.nan)
+        return {"bucket_rows": self.bucket_rows, "time": time.tolist(), "min": low.tolist(), "max": high.tolist()}
+
+
+class SoakAnalyzer:
+    """Streaming statistics of a soak log, fed chunk by chunk"""
+
+    def __init__(
+        self,
+        power="rx_power",
+        time="time_elapsed",
+        errors="err_seconds",
+        window=720,
+        step=60,
+        percentiles=(5, 50, 95),
+        points=2000,
+        period=None,
+        gap_factor=1.5,
+        histogram=(-60.0, 20.0, 0.001),
+        max_events=1000,
+    ):
+        """
+        :param power, time, errors: Column names (case insensitive), e.g. "Rx_power" in data.txt
+        :param window: Samples per window (720 = 1 hour at 5 s)
+        :param step: Samples between the ends of consecutive windows (60 = 5 minutes at 5 s), window: tumbling windows
+        :param points: Decimated series size, see MinMaxDecimator
+        :param period: Sample period in the time unit, None: the median of the first chunk
+        :param gap_factor: A gap longer than gap_factor * period is a drop out
+        :param histogram: (low, high, bin width) of the rx power histogram of the overall percentiles
+        :param max_events: Error onsets, drop outs and restarts kept each (the first ones), the rest is only counted
+        """
+        self.names = {"power": power, "time": time, "errors": errors}
+        self.window = window
+        self.step = step
+        self.percentiles = tuple(percentiles)
+        self.period = period
+        self.gap_factor = gap_factor
+        self.decimator = MinMaxDecimator(points)
+
+        low, high, width = histogram
+        self.histogram_edges = np.arange(low, high + width, width)
+        self.histogram = np.zeros(len(self.histogram_edges) + 1, dtype=np.int64)  # + below low and above high
+
+        self.rows = 0
+        self.count = 0  # rows with a rx power value
+        self.sum = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.max_events = max_events
+        self.onsets = []  # {"time", "error_seconds"}
+        self.drop_outs = []  # {"start", "end", "missing"}
+        self.restarts = []  # {"time", "previous"}
+        self.event_counts = {"error_onsets": 0, "drop_outs": 0, "restarts": 0}
+        # Last time and error seconds of the previous chunk, the last ``window`` samples and the end (row count) of
+        # the last window
+        self.last_time = None
+        self.last_errors = None
+        self.window_time = np.empty(0)
+        self.window_power = np.empty(0)
+        self.window_end = 0
+
+    def feed(self, chunk):
+        """Add a chunk (dict name -> array), return: list of the windows completed by it"""
+        power = _column(chunk, self.names["power"])
+        if power is None:
+            raise KeyError(f"No column {self.names['power']} in {list(chunk)}")
+        time = _column(chunk, self.names["time"])
+        if time is None:
+            time = np.arange(self.rows, self.rows + len(power), dtype=np.float64)
+        errors = _column(chunk, self.names["errors"])
+        self.rows += len(power)
+
+        self._power_stats(power)
+        self._timing(time)
+        if errors is not None:
+            self._onsets(time, errors)
+        self.decimator.feed(time, power)
+        return self._windows(time, power)
+
+    def _power_stats(self, power):
+        valid = power[np.isfinite(power)]
+        if not len(valid):
+            return
+        self.count += len(valid)
+        self.sum += float(valid.sum())
+        self.min = min(self.min, float(valid.min()))
+        self.max = max(self.max, float(valid.max()))
+        self.histogram += np.bincount(
+            np.searchsorted(self.histogram_edges, valid, side="right"), minlength=len(self.histogram)
+        )
+
+    def _timing(self, time):
+        """Drop outs and restarts, including the step from the previous chunk"""
+        if self.last_time is not None:
+            time = np.concatenate([[self.last_time], time])
+        if len(time) < 2:
+            self.last_time = time[-1] if len(time) else self.last_time
+            return
+        steps = np.diff(time)
+        if self.period is None:
+            forward = steps[steps > 0]
+            if len(forward):
+                self.period = float(np.median(forward))
+        if self.period:
+            for index in np.flatnonzero(steps > self.gap_factor * self.period):
+                self._event(
+                    "drop_outs",
+                    self.drop_outs,
+                    {
+                        "start": float(time[index]),
+                        "end": float(time[index + 1]),
+                        "missing": int(round(steps[index] / self.period)) - 1,
+                    },
+                )
+        for index in np.flatnonzero(steps < 0):
+            self._event("restarts", self.restarts, {"time": float(time[index + 1]), "previous": float(time[index])})
+        self.last_time = time[-1]
+
+    def _onsets(self, time, errors):
+        previous = np.concatenate([[self.last_errors if self.last_errors is not None else errors[0]], errors[:-1]])
+        for index in np.flatnonzero(errors > previous):
+            onset = {"time": float(time[index]), "error_seconds": float(errors[index])}
+            self._event("error_onsets", self.onsets, onset)
+        self.last_errors = errors[-1]
+
+    def _event(self, kind, events, event):
+        """Count an event, keep it while there are less than max_events"""
+        self.event_counts[kind] += 1
+        if len(events) < self.max_events:
+            events.append(event)
+
+    def _windows(self, time, power):
+        """Stats of the windows ending in this chunk, windows end at rows window, window + step, window + 2 * step..."""
+        first = self.rows - len(power)  # row of the first sample of the chunk
+        time = np.concatenate([self.window_time, time])
+        power = np.concatenate([self.window_power, power])
+        offset = self.rows - len(power)  # row of time[0]
+        windows = []
+        steps = max((first - self.window) // self.step + 1, 0)
+        for end in range(self.window + steps * self.step, self.rows + 1, self.step):
+            start = end - self.window - offset
+            windows.append(self._window_stats(time[start : end - offset], power[start : end - offset]))
+            self.window_end = end
+        keep = min(len(power), self.window)
+        self.window_time, self.window_power = time[len(time) - keep :], power[len(power) - keep :]
+        return windows
+
+    def _window_stats(self, time, power):
+        valid = power[np.isfinite(power)]
+        stats = {"start": float(time[0]), "end": float(time[-1]), "samples": len(power), "valid": len(valid)}
+        if len(valid):
+            stats.update(min=float(valid.min()), max=float(valid.max()), mean=float(valid.mean()))
+            for percentile, value in zip(self.percentiles, np.percentile(valid, self.percentiles)):
+                stats[f"p{percentile}"] = float(value)
+        return stats
+
+    def histogram_percentile(self, percentile):
+        """return: rx power percentile over the whole log, to the histogram bin width"""
+        if not self.count:
+            return None
+        cumulative = np.cumsum(self.histogram)
+        index = int(np.searchsorted(cumulative, percentile / 100 * self.count))
+        index = min(max(index, 1), len(self.histogram_edges)) - 1
+        return round(float(self.histogram_edges[index]), 9)
+
+    def finish(self):
+        """return: summary dict of the whole log, with a last window of the last samples if they did not end one
+        (shorter than window if the log is)
+        """
+        last_window = []
+        if self.window_end < self.rows:
+            last_window = [self._window_stats(self.window_time, self.window_power)]
+            self.window_end = self.rows
+        overall = {"rows": self.rows, "valid": self.count}
+        if self.count:
+            overall.update(min=self.min, max=self.max, mean=self.sum / self.count)
+            for percentile in self.percentiles:
+                overall[f"p{percentile}"] = self.histogram_percentile(percentile)
+        return {
+            "overall": overall,
+            "period": self.period,
+            "last_window": last_window,
+            "error_onsets": self.onsets,
+            "drop_outs": self.drop_outs,
+            "restarts": self.restarts,
+            "event_counts": dict(self.event_counts),
+            "decimated": self.decimator.result(),
+        }
+
+
+def analyze(path, chunk_rows=65536, on_window=None, **kwargs):
+    """Analyze a soak log (CSV or recorder file) in one pass
+    :param on_window: Called with the stats dict of every window as it completes, None drops them
+    :param kwargs: SoakAnalyzer parameters
+    :return: SoakAnalyzer.finish() summary with "windows", the number of windows
+    """
+    analyzer = SoakAnalyzer(**kwargs)
+    count = 0
+    for chunk in chunks(path, chunk_rows):
+        for window in analyzer.feed(chunk):
+            count += 1
+            if on_window is not None:
+                on_window(window)
+    summary = analyzer.finish()
+    for window in summary.pop("last_window"):
+        count += 1
+        if on_window is not None:
+            on_window(window)
+    summary["windows"] = count
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single pass statistics of a soak log (CSV or recorder file)")
+    parser.add_argument("log", help="e.g. data.txt or data.rec")
+    parser.add_argument("--power", default="rx_power", help="rx power column")
+    parser.add_argument("--time", default="time_elapsed", help="time column, e.g. host_time")
+    parser.add_argument("--errors", default="err_seconds", help="error seconds column")
+    parser.add_argument("--window", type=int, default=720, help="samples per window")
+    parser.add_argument("--step", type=int, default=60, help="samples between windows, --window for tumbling windows")
+    parser.add_argument("--points", type=int, default=2000, help="decimated series size")
+    parser.add_argument("--output", help="write the summary as JSON")
+    parser.add_argument("--windows", help="write the window stats as JSON lines")
+    args = parser.parse_args()
+
+    windows_file = open(args.windows, "w") if args.windows else None
+    on_window = (lambda window: windows_file.write(json.dumps(window) + "\n")) if windows_file else None
+    summary = analyze(
+        args.log,
+        on_window=on_window,
+        power=args.power,
+        time=args.time,
+        errors=args.errors,
+        window=args.window,
+        step=args.step,
+        points=args.points,
+    )
+    if windows_file:
+        windows_file.close()
+    counts = summary["event_counts"]
+    print(f"overall: {summary['overall']}")
+    print(f"period: {summary['period']}, windows: {summary['windows']}")
+    print(f"error second onsets: {counts['error_onsets']}, drop outs: {counts['drop_outs']}, "
+          f"restarts: {counts['restarts']}")
+    for drop_out in summary["drop_outs"][:10]:
+        print(f"  drop out {drop_out['start']} -> {drop_out['end']}, {drop_out['missing']} samples missing")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(summary, file, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+========================================================================================================================
+# Information
+Benchmarks of the Mpa2100 hot paths against the local simulator (simulator.py), with a configurable latency per
+command. Reports p50/p95/p99 latency, throughput and bytes on the wire per operation and stores the results as JSON,
+so runs of different releases can be compared:
+
+    python bench.py --latency 0.001 --output bench_v1.json
+    python bench.py --latency 0.001 --compare bench_v1.json
+========================================================================================================================
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+import viavi
+from simulator import Delay, Simulator
+
+APPLICATION = "TermEth100GL2Traffic_101"
+
+
+def _connected(simulator, **kwargs):
+    """return: Mpa2100 connected to the simulator with the application selected and a session started"""
+    instrument = viavi.Mpa2100(port=simulator.base_port, port_cache=viavi.PortCache(), **kwargs)
+    instrument.connect(simulator.host)
+    instrument.remote_operational_mode()
+    instrument.select_application(APPLICATION)
+    instrument.remote_session_start()
+    return instrument
+
+
+def _connect(simulator, instrument):
+    """Connection setup with the full port discovery (base -> module -> BERT port)"""
+    fresh = viavi.Mpa2100(port=simulator.base_port, port_cache=viavi.PortCache())
+    fresh.connect(simulator.host, use_cache=False)
+    fresh.close()
+
+
+def _connect_cached(simulator, instrument):
+    """Connection setup with the BERT port from the port cache"""
+    fresh = viavi.Mpa2100(port=simulator.base_port, port_cache=instrument.port_cache)
+    fresh.connect(simulator.host)
+    fresh.close()
+
+
+def _read_page(simulator, instrument):
+    with contextlib.redirect_stdout(io.StringIO()):
+        instrument.i2c_read_page_qsfp(0)
+
+
+def _soak_sample(simulator, instrument):
+    """One sample of the soak loop as three queries"""
+    instrument.read_Rx_power()
+    instrument.test_time()
+    instrument.error_present()
+
+
+def _laser_toggle(simulator, instrument):
+    instrument.laser_toggle()
+
+
+# name -> operation(simulator, instrument)
+BENCHMARKS = {
+    "connect": _connect,
+    "connect_cached": _connect_cached,
+    "read_i2c": lambda simulator, instrument: instrument.read_i2c(0, 148),
+    "i2c_read_page_qsfp": _read_page,
+    "read_pre_fec_ber_INPHI": lambda simulator, instrument: instrument.read_pre_fec_ber_INPHI(),
+    "read_pre_fec_ber_Eopto": lambda simulator, instrument: instrument.read_pre_fec_ber_Eopto(),
+    "soak_sample": _soak_sample,
+    "read_soak_sample": lambda simulator, instrument: instrument.read_soak_sample(),
+    "read_ddm": lambda simulator, instrument: instrument.read_ddm(),
+    "laser_toggle": _laser_toggle,
+}
+
+
+def run_benchmark(simulator, instrument, operation, iterations=50, warmup=3):
+    """Time an operation
+    :return: dict with latency percentiles (s), throughput (ops/s) and bytes on the wire per operation
+    """
+    for _ in range(warmup):
+        operation(simulator, instrument)
+
+    received, sent, commands = simulator.bytes_received, simulator.bytes_sent, simulator.commands
+    latencies = np.empty(iterations)
+    start = time.perf_counter()
+    for index in range(iterations):
+        started = time.perf_counter()
+        operation(simulator, instrument)
+        latencies[index] = time.perf_counter() - started
+    total = time.perf_counter() - start
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "iterations": iterations,
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "mean": float(latencies.mean()),
+        "max": float(latencies.max()),
+        "throughput": iterations / total,
+        "bytes_sent": (simulator.bytes_received - received) / iterations,
+        "bytes_received": (simulator.bytes_sent - sent) / iterations,
+        "commands": (simulator.commands - commands) / iterations,
+    }
+
+
+def _version():
+    try:
+        result = subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def run(names=None, iterations=50, warmup=3, latency=0.0, jitter=0.0, seed=0, validate=True):
+    """Run the benchmarks against a simulator started in the background
+    :return: dict with "meta" (settings, version) and "results" (name -> run_benchmark dict)
+    """
+    simulator = Simulator(base_port=0, default=Delay(latency, jitter), seed=seed).start_background()
+    try:
+        instrument = _connected(simulator, validate=validate)
+        instrument.laser_on()
+        results = {}
+        for name in names or BENCHMARKS:
+            results[name] = run_benchmark(simulator, instrument, BENCHMARKS[name], iterations, warmup)
+        instrument.close()
+    finally:
+        simulator.stop_background()
+    meta = {
+        "version": _version(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "iterations": iterations,
+        "latency": latency,
+        "jitter": jitter,
+        "seed": seed,
+        "validate": validate,
+    }
+    return {"meta": meta, "results": results}
+
+
+def compare(results, baseline):
+    """return: report lines with the p50/p95/throughput change of each benchmark against a baseline run"""
+    lines = [f"{'benchmark':24} {'p50 ms':>9} {'change':>8} {'p95 ms':>9} {'change':>8} {'ops/s':>9} {'change':>8}"]
+    for name, result in results["results"].items():
+        old = baseline["results"].get(name)
+        columns = [f"{name:24}"]
+        for key, scale in (("p50", 1000), ("p95", 1000), ("throughput", 1)):
+            change = f"{result[key] / old[key] - 1:+.1%}" if old and old[key] else "new"
+            columns.append(f"{result[key] * scale:9.3f} {change:>8}")
+        lines.append(" ".join(columns))
+    return lines
+
+
+def report(results):
+    """return: report lines of a run"""
+    lines = [f"{'benchmark':24} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>9} {'B sent':>8} {'B recv':>8}"]
+    for name, result in results["results"].items():
+        lines.append(
+            f"{name:24} {result['p50'] * 1000:9.3f} {result['p95'] * 1000:9.3f} {result['p99'] * 1000:9.3f} "
+            f"{result['throughput']:9.1f} {result['bytes_sent']:8.0f} {result['bytes_received']:8.0f}"
+        )
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Mpa2100 hot paths against the local simulator")
+    parser.add_argument("benchmarks", nargs="*", help=f"default: all of {', '.join(BENCHMARKS)}")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per command")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random seconds per command")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-validate", action="store_true", help="no client side command validation")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark '{name}'")
+
+    results = run(
+        args.benchmarks, args.iterations, args.warmup, args.latency, args.jitter, args.seed, not args.no_validate
+    )
+    print("\n".join(report(results)))
+    if args.compare:
+        with open(args.compare) as file:
+            print("\n".join(compare(results, json.load(file))))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+========================================================================================================================
+# Information
+Pre-FEC BER decoding for the vendor page registers (e.g. page 20h bytes 182-183 INPHI, 158-159 Eopto).
+The 16-bit register value (first byte << 8 | second byte) holds a 5-bit exponent and an 11-bit mantissa:
+    BER = mantissa * 10 ** (exponent - 24)
+(the same value as the old "mantissa / 1000 E exponent - 21" print for mantissa >= 1000).
+Works on single values and on whole NumPy arrays, e.g. BER histories from soak logs.
+========================================================================================================================
+"""
+
+import numpy as np
+
+EXPONENT_SHIFT = 11
+MANTISSA_MASK = 0x7FF
+EXPONENT_OFFSET = 24
+
+# 10 ** (exponent - 24) for all 32 exponents, indexed instead of computing a power per sample
+_SCALE = 10.0 ** (np.arange(32) - EXPONENT_OFFSET)
+
+
+def combine_registers(msb, lsb):
+    """return: 16-bit register values from the first (msb) and second (lsb) byte, int or uint16 array"""
+    if np.isscalar(msb) and np.isscalar(lsb):
+        return (int(msb) << 8) | int(lsb)
+    return (np.asarray(msb, dtype=np.uint16) << 8) | np.asarray(lsb, dtype=np.uint16)
+
+
+def decode_pre_fec_ber(raw):
+    """Decode pre-FEC BER register values
+    :param raw: 16-bit register value, or array-like of them
+    :return: float, or float64 array with the shape of raw
+    """
+    values = np.asarray(raw, dtype=np.uint16)
+    ber = (values & MANTISSA_MASK) * _SCALE[values >> EXPONENT_SHIFT]
+    if ber.ndim == 0:
+        return float(ber)
+    return ber
+
+
+def decode_pre_fec_ber_hex(msb_hex, lsb_hex):
+    """return: BER as float from two registers as hex strings, e.g. read_i2c() results ("3c", "e8")"""
+    return decode_pre_fec_ber(int(msb_hex + lsb_hex, 16))
@@ -0,0 +1,358 @@
+"""
+========================================================================================================================
+# Information
+Compact index of the SCPI catalog in "VIAVI/Mts Applications" (one text file of mnemonics per application).
+
+The build step interns all mnemonics into one sorted string table and stores one bitset (a bit per mnemonic) per
+distinct command set; applications with identical command sets share a bitset. The loader memory-maps the index and
+decodes strings only when they are looked at, so opening it takes milliseconds.
+
+The index is built explicitly (python catalog.py build) into the user cache directory ($XDG_CACHE_HOME/viavi or
+~/.cache/viavi), never into the source tree. It records a fingerprint of the application files (names, sizes and
+mtimes); an index that does not match the files any more is still used, with a warning to build it again.
+
+    python catalog.py build
+    python catalog.py apps PHYSICAL:QSFP:RX:LOS:LN1     (result name, the type prefix e.g. CSTATUS: is optional)
+    python catalog.py prefix :SENSE:EXPERT:I2C:PEEK
+
+File layout (little endian):
+    header   b"MTSCAT02", 16 byte source fingerprint, u32 mnemonics, u32 applications, u32 bitsets, u32 bitset bytes,
+             u32 apps JSON length
+    apps     JSON {"applications": [names], "types": [:SENSE:DATA? result types, e.g. "CSTATUS"]}
+    set_ids  u16 per application, index of its bitset
+    offsets  u32 per mnemonic + 1, into the string table
+    strings  sorted mnemonics, ascii
+    bitsets  u8 [bitsets, bitset bytes], padded to 8 bytes
+========================================================================================================================
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+
+import numpy as np
+
+from scpi import DATA_QUERY
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MTSCAT02"
+HEADER = struct.Struct("<8s16sIIIII")
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "VIAVI", "Mts Applications")
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "viavi")
+INDEX_PATH = os.path.join(CACHE_DIR, "mts_catalog.idx")
+
+
+def normalize(mnemonic):
+    """return: catalog form of a mnemonic, e.g. "physical:qsfp:rx:los:ln1" -> ":SENSE:DATA? PHYSICAL:QSFP:RX:LOS:LN1"
+    (names without a leading ":" or "*" are :SENSE:DATA? results)
+    """
+    mnemonic = " ".join(mnemonic.upper().split())
+    if not mnemonic.startswith((":", "*")):
+        mnemonic = ":SENSE:DATA? " + mnemonic
+    return mnemonic
+
+
+# Instrument level commands, handled by the system and not by an application (not in the catalog)
+SYSTEM_PREFIXES = ("*", ":SYST", ":SESS", ":EXIT", ":ABOR", ":INIT", "MOD:")
+
+
+def command_mnemonics(command):
+    """return: list of (part, mnemonic) for a (compound) command, in catalog form, system commands left out
+    e.g. ":SENSe:DATA? SECOND:TEST:ELAPSED ;:OUTPUT:OPTIC ON" -> ":SENSE:DATA? SECOND:TEST:ELAPSED", ":OUTPUT:OPTIC"
+    """
+    result = []
+    for part in command.split(";"):
+        words = part.split()
+        if not words or words[0].upper().startswith(SYSTEM_PREFIXES):
+            continue
+        header = words[0].upper()
+        if DATA_QUERY.match(header):
+            result.append((part.strip(), ":SENSE:DATA? " + (words[1].upper() if len(words) > 1 else "")))
+        else:
+            result.append((part.strip(), header.rstrip("?")))
+    return result
+
+
+def application_name(application):
+    """return: catalog name of a running application, e.g. "TermEth100GL2Traffic_101" -> "TermEth100GL2Traffic" """
+    return re.sub(r"_10\d$", "", application)
+
+
+def source_fingerprint(source_dir=SOURCE_DIR):
+    """return: 16 byte digest of the names, sizes and mtimes of the application files (one stat per file, no reads)"""
+    digest = hashlib.blake2b(digest_size=16)
+    for entry in sorted(os.scandir(source_dir), key=lambda entry: entry.name):
+        if entry.name.endswith(".txt"):
+            stat = entry.stat()
+            digest.update(f"{entry.name}/{stat.st_size}/{stat.st_mtime_ns}\n".encode("utf-8", "surrogateescape"))
+    return digest.digest()
+
+
+def build_index(source_dir=SOURCE_DIR, path=INDEX_PATH):
+    """Build the index file from the per application text files
+    :return: (mnemonics, applications, bitsets)
+    """
+    fingerprint = source_fingerprint(source_dir)
+    applications = {}
+    for file_name in sorted(os.listdir(source_dir)):
+        if not file_name.endswith(".txt"):
+            continue
+        with open(os.path.join(source_dir, file_name), encoding="ascii", errors="replace") as file:
+            applications[file_name[:-4]] = frozenset(normalize(line) for line in file if line.strip())
+
+    mnemonics = sorted(set().union(*applications.values()))
+    ids = {mnemonic: number for number, mnemonic in enumerate(mnemonics)}
+    bitset_bytes = (len(mnemonics) + 7) // 8
+
+    # One bitset per distinct command set
+    set_ids = {}
+    bitsets = []
+    app_set_ids = []
+    for commands in applications.values():
+        if commands not in set_ids:
+            bits = np.zeros(bitset_bytes * 8, dtype=bool)
+            bits[[ids[mnemonic] for mnemonic in commands]] = True
+            set_ids[commands] = len(bitsets)
+            bitsets.append(np.packbits(bits, bitorder="little"))
+        app_set_ids.append(set_ids[commands])
+
+    strings = "".join(mnemonics).encode("ascii")
+    offsets = np.zeros(len(mnemonics) + 1, dtype="<u4")
+    offsets[1:] = np.cumsum([len(mnemonic) for mnemonic in mnemonics])
+    types = sorted({mnemonic.split(" ", 1)[1].split(":")[0] for mnemonic in mnemonics if " " in mnemonic} - {""})
+    apps = json.dumps({"applications": list(applications), "types": types}).encode("ascii")
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as file:
+        file.write(
+            HEADER.pack(MAGIC, fingerprint, len(mnemonics), len(applications), len(bitsets), bitset_bytes, len(apps))
+        )
+        file.write(apps)
+        file.write(np.asarray(app_set_ids, dtype="<u2").tobytes())
+        file.write(b"\0" * (-file.tell() % 4))
+        file.write(offsets.tobytes())
+        file.write(strings)
+        file.write(b"\0" * (-file.tell() % 8))
+        file.write(np.asarray(bitsets, dtype=np.uint8).tobytes())
+    os.replace(path + ".tmp", path)
+    return len(mnemonics), len(applications), len(bitsets)
+
+
+class Catalog:
+    """Lazily loaded, memory-mapped catalog index"""
+
+    def __init__(self, path=INDEX_PATH, source_dir=SOURCE_DIR):
+        """Open a built index (see build_index)
+        :param source_dir: Application files the index is compared with, see ``stale``
+        :raise FileNotFoundError: if the index was not built
+        """
+        self.file = open(path, "rb")
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, fingerprint, self.size, app_count, set_count, bitset_bytes, apps_length = HEADER.unpack_from(
+            self.buffer, 0
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog index of this version")
+        # The application files changed since the build
+        self.stale = os.path.isdir(source_dir) and fingerprint != source_fingerprint(source_dir)
+        offset = HEADER.size
+        names = json.loads(self.buffer[offset : offset + apps_length].decode("ascii"))
+        self.applications = names["applications"]
+        self.types = names["types"]
+        self._app_index = {application: number for number, application in enumerate(self.applications)}
+        offset += apps_length
+        self.set_ids = np.frombuffer(self.buffer, dtype="<u2", count=app_count, offset=offset)
+        offset += 2 * app_count
+        offset += -offset % 4
+        self.offsets = np.frombuffer(self.buffer, dtype="<u4", count=self.size + 1, offset=offset)
+        offset += 4 * (self.size + 1)
+        self.strings_offset = offset
+        offset += int(self.offsets[-1])
+        offset += -offset % 8
+        self.bitsets = np.frombuffer(self.buffer, dtype=np.uint8, count=set_count * bitset_bytes, offset=offset)
+        self.bitsets = self.bitsets.reshape(set_count, bitset_bytes)
+
+    def mnemonic(self, number):
+        """return: mnemonic string by id"""
+        start = self.strings_offset + int(self.offsets[number])
+        end = self.strings_offset + int(self.offsets[number + 1])
+        return self.buffer[start:end].decode("ascii")
+
+    def _bisect(self, key):
+        """return: first id with mnemonic >= key"""
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.mnemonic(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _find(self, key):
+        number = self._bisect(key)
+        if number < self.size and self.mnemonic(number) == key:
+            return number
+        return None
+
+    def find(self, mnemonic):
+        """return: id of a mnemonic, None if it is not in the catalog
+        A :SENSE:DATA? result name without its type (e.g. PHYSICAL:QSFP:RX:LOS:LN1) matches any type
+        """
+        key = normalize(mnemonic)
+        number = self._find(key)
+        if number is None and not mnemonic.lstrip().startswith((":", "*")):
+            result = key.split(" ", 1)[1]
+            for result_type in self.types:
+                number = self._find(f":SENSE:DATA? {result_type}:{result}")
+                if number is not None:
+                    break
+        return number
+
+    def resolve(self, mnemonic):
+        """return: id of a mnemonic, None if it is not in the catalog
+        Header nodes may be SCPI short forms (e.g. ":SENS:EXPE:I2C:PEEK:REGADDR"), a node of 3 or more characters
+        matches the catalog nodes it is the start of.
+        """
+        number = self.find(mnemonic)
+        key = normalize(mnemonic)
+        if number is not None or key.startswith(":SENSE:DATA? "):
+            return number
+
+        candidates = [""]
+        for node in key[1:].split(":"):
+            candidates = [
+                f"{candidate}:{name}"
+                for candidate in candidates
+                for name in self._child_nodes(candidate, node)
+                if name == node or len(node) >= 3
+            ]
+        for candidate in candidates:
+            number = self._find(candidate)
+            if number is not None:
+                return number
+        return None
+
+    def _child_nodes(self, parent, start):
+        """return: set of the header nodes after ``parent`` starting with ``start``, skipping over their children"""
+        names = set()
+        key = f"{parent}:{start}"
+        number = self._bisect(key)
+        while number < self.size:
+            mnemonic = self.mnemonic(number)
+            if not mnemonic.startswith(key):
+                break
+            rest = mnemonic[len(parent) + 1 :]
+            name = re.split("[: ]", rest)[0]
+            names.add(name)
+            # Children of a node are contiguous: "NAME:..." sort before "NAME;", "NAME ..." before "NAME!"
+            if rest[len(name) :].startswith(":"):
+                number = self._bisect(f"{parent}:{name};")
+            elif rest[len(name) :].startswith(" "):
+                number = self._bisect(f"{parent}:{name}!")
+            else:
+                number += 1
+        return names
+
+    def prefix(self, prefix):
+        """return: list of mnemonics starting with prefix (normalized, e.g. ":SENSE:EXPERT:I2C")"""
+        key = normalize(prefix)
+        result = []
+        number = self._bisect(key)
+        while number < self.size:
+            mnemonic = self.mnemonic(number)
+            if not mnemonic.startswith(key):
+                break
+            result.append(mnemonic)
+            number += 1
+        return result
+
+    def _bitset(self, application):
+        number = self._app_index.get(application_name(application))
+        if number is None:
+            raise KeyError(f"Application '{application}' is not in the catalog")
+        return self.bitsets[self.set_ids[number]]
+
+    def supports(self, application, mnemonic):
+        """return: True if the application has the mnemonic (short forms allowed, see resolve)"""
+        number = self.resolve(mnemonic)
+        if number is None:
+            return False
+        return bool(self._bitset(application)[number >> 3] >> (number & 7) & 1)
+
+    def applications_supporting(self, mnemonic):
+        """return: list of applications that has the mnemonic"""
+        number = self.find(mnemonic)
+        if number is None:
+            return []
+        sets = (self.bitsets[:, number >> 3] >> (number & 7)) & 1
+        return [self.applications[index] for index in np.flatnonzero(sets[self.set_ids])]
+
+    def commands(self, application):
+        """return: list of all mnemonics of an application"""
+        bits = np.unpackbits(self._bitset(application), bitorder="little")[: self.size]
+        return [self.mnemonic(number) for number in np.flatnonzero(bits)]
+
+    def has_application(self, application):
+        return application_name(application) in self._app_index
+
+    def close(self):
+        del self.set_ids, self.offsets, self.bitsets
+        self.buffer.close()
+        self.file.close()
+
+
+_catalog = None
+_unavailable = False
+
+
+def get_catalog():
+    """return: the Catalog shared by the process, opened on first use; None if the index is not built"""
+    global _catalog, _unavailable
+    if _catalog is None and not _unavailable:
+        try:
+            _catalog = Catalog()
+        except (OSError, ValueError) as error:
+            logger.warning("SCPI catalog not available (%s), run: python catalog.py build", error)
+            _unavailable = True
+            return None
+        if _catalog.stale:
+            logger.warning(
+                "SCPI catalog %s does not match %s any more, run: python catalog.py build", INDEX_PATH, SOURCE_DIR
+            )
+    return _catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index and query the VIAVI MTS application SCPI catalog")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    subparsers.add_parser("build", help="build the index from VIAVI/Mts Applications into the user cache directory")
+    apps = subparsers.add_parser("apps", help="list the applications supporting a mnemonic")
+    apps.add_argument("mnemonic")
+    prefix = subparsers.add_parser("prefix", help="list the mnemonics starting with a prefix")
+    prefix.add_argument("prefix")
+    commands = subparsers.add_parser("commands", help="list the mnemonics of an application")
+    commands.add_argument("application")
+    args = parser.parse_args()
+
+    if args.action == "build":
+        mnemonics, applications, bitsets = build_index()
+        print(f"{INDEX_PATH}: {mnemonics} mnemonics, {applications} applications, {bitsets} distinct command sets")
+    elif args.action == "apps":
+        print("\n".join(Catalog().applications_supporting(args.mnemonic)))
+    elif args.action == "prefix":
+        print("\n".join(Catalog().prefix(args.prefix)))
+    elif args.action == "commands":
+        print("\n".join(Catalog().commands(args.application)))
+
+
+if __name__ == "__main__":
+    main()
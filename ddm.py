@@ -0,0 +1,78 @@
+"""
+========================================================================================================================
+# Information
+Digital diagnostics (DDM) decoding of the QSFP monitor block, lower page bytes 22-57 (SFF-8636), big endian:
+    22-23 temperature   signed, 1/256 degC        26-27 Vcc          unsigned, 100 uV
+    34-41 rx power      4 lanes, unsigned, 0.1 uW 42-49 tx bias      4 lanes, unsigned, 2 uA
+    50-57 tx power      4 lanes, unsigned, 0.1 uW
+The block is read with one read_i2c_block and decoded at once into a record in SI units (degC, V, A, W). Works on a
+single block and on many blocks (e.g. a soak log of raw blocks) as NumPy record arrays.
+
+    ddm = a.read_ddm()
+    print(ddm["temperature"], ddm["rx_power"], dbm(ddm["rx_power"]))
+========================================================================================================================
+"""
+
+import numpy as np
+
+FIRST_ADDRESS = 22
+LENGTH = 36
+LANES = 4
+
+# Register layout of the monitor block
+RAW = np.dtype(
+    [
+        ("temperature", ">i2"),
+        ("reserved_24", ">u2"),
+        ("vcc", ">u2"),
+        ("reserved_28", "V6"),
+        ("rx_power", ">u2", LANES),
+        ("tx_bias", ">u2", LANES),
+        ("tx_power", ">u2", LANES),
+    ]
+)
+
+# Decoded record, SI units
+DDM = np.dtype(
+    [
+        ("temperature", "f8"),  # degC
+        ("vcc", "f8"),  # V
+        ("rx_power", "f8", LANES),  # W
+        ("tx_bias", "f8", LANES),  # A
+        ("tx_power", "f8", LANES),  # W
+    ]
+)
+
+# Register LSB in SI units
+SCALE = {
+    "temperature": 1 / 256,
+    "vcc": 100e-6,
+    "rx_power": 0.1e-6,
+    "tx_bias": 2e-6,
+    "tx_power": 0.1e-6,
+}
+
+
+def decode_ddm(data):
+    """Decode monitor blocks
+    :param data: bytes of one block (36 registers from address 22), or of several blocks back to back
+    :return: DDM record (numpy.void) for one block, DDM record array for several blocks
+    """
+    if len(data) % LENGTH:
+        raise ValueError(f"Expected a multiple of {LENGTH} registers, got {len(data)}")
+    raw = np.frombuffer(data, dtype=RAW)
+    ddm = np.empty(len(raw), dtype=DDM)
+    for name, scale in SCALE.items():
+        ddm[name] = raw[name] * scale
+    if len(ddm) == 1:
+        return ddm[0]
+    return ddm
+
+
+def dbm(watts):
+    """return: power in dBm, -inf for 0 W; float or array like watts"""
+    with np.errstate(divide="ignore"):
+        power = 10 * np.log10(np.asarray(watts, dtype=float) * 1000)
+    if power.ndim == 0:
+        return float(power)
+    return power
@@ -0,0 +1,153 @@
+"""
+========================================================================================================================
+# Information
+Both ports of one MTS-5800/MPA-2100, driven concurrently. Every port application (e.g. TermEth100GL2Traffic_101
+and TermEth100GL2Traffic_102) gets its own connection with its own selected application and session, so the laser,
+traffic, I2C and monitor operations of two DUTs run in parallel instead of back to back. Results are returned as a
+dict application -> result.
+
+    with DualPort("10.10.40.197") as ports:
+        ports.laser_on()
+        print(ports.read_ddm())
+        print(ports.call("i2c_read_page_qsfp", "BasePage"))
+========================================================================================================================
+"""
+
+import concurrent.futures
+
+from viavi import Mpa2100
+
+
+class DualPort:
+    """One Mpa2100 connection per port application of an instrument"""
+
+    def __init__(self, host, applications=None, port=8000, timeout=30, port_cache=None, validate=True, metrics=None):
+        """
+        :param host: Instrument address
+        :param applications: Port applications, e.g. ["TermEth100GL2Traffic_101", "TermEth40GL2Traffic_102"],
+            None uses the running applications (see Mpa2100.show_running_applications)
+        :param port: Base port of the instrument
+        """
+        self.host = host
+        self.applications = list(applications) if applications is not None else None
+        self.instrument_kwargs = dict(
+            port=port, timeout=timeout, port_cache=port_cache, validate=validate, metrics=metrics
+        )
+        self.instruments = {}  # application -> Mpa2100
+        self.executor = None
+
+    def open(self):
+        """Connect once per application, select the application and start a session on every connection"""
+        # The first connection runs the port discovery (if not cached) and finds the running applications
+        first = Mpa2100(**self.instrument_kwargs)
+        first.connect(self.host)
+        try:
+            if self.applications is None:
+                self.applications = first.show_running_applications()
+                if not self.applications:
+                    raise ValueError(f"No port application is running on {self.host}")
+            self.executor = concurrent.futures.ThreadPoolExecutor(len(self.applications), thread_name_prefix="port")
+
+            def setup(application, instrument):
+                created = instrument is None
+                if created:
+                    instrument = Mpa2100(**self.instrument_kwargs)
+                    instrument.connect(self.host)
+                try:
+                    instrument.remote_operational_mode()
+                    instrument.select_application(application)
+                    instrument.remote_session_start()
+                except Exception:
+                    # The first connection is closed by open()
+                    if created:
+                        instrument.close()
+                    raise
+                return instrument
+
+            futures = {
+                application: self.executor.submit(setup, application, first if index == 0 else None)
+                for index, application in enumerate(self.applications)
+            }
+            concurrent.futures.wait(futures.values())
+            for application, future in futures.items():
+                if future.exception() is None:
+                    self.instruments[application] = future.result()
+            if len(self.instruments) < len(self.applications):
+                raise next(future.exception() for future in futures.values() if future.exception() is not None)
+        except Exception:
+            # close() closes the instruments that are set up, first too unless its setup failed
+            first_set_up = any(instrument is first for instrument in self.instruments.values())
+            self.close()
+            if not first_set_up:
+                first.close()
+            raise
+        return self
+
+    def call(self, name, *args, **kwargs):
+        """Call an Mpa2100 method on every port at the same time
+        :param name: Method name, e.g. "laser_on" or "read_i2c_block"
+        :return: dict application -> result
+        :raise: the first exception of a port, after all ports have finished
+        """
+        futures = {
+            application: self.executor.submit(getattr(instrument, name), *args, **kwargs)
+            for application, instrument in self.instruments.items()
+        }
+        concurrent.futures.wait(futures.values())
+        for future in futures.values():
+            if future.exception() is not None:
+                raise future.exception()
+        return {application: future.result() for application, future in futures.items()}
+
+    def __getitem__(self, application):
+        """return: the Mpa2100 of one port, e.g. ports["TermEth100GL2Traffic_102"].read_Rx_power()"""
+        return self.instruments[application]
+
+    def close(self):
+        for instrument in self.instruments.values():
+            instrument.close()
+        self.instruments.clear()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Laser, traffic
+    def laser_on(self):
+        return self.call("laser_on")
+
+    def laser_off(self):
+        return self.call("laser_off")
+
+    def laser_status(self):
+        return self.call("laser_status")
+
+    def traffic_mac_start(self):
+        return self.call("traffic_mac_start")
+
+    def traffic_mac_stop(self):
+        return self.call("traffic_mac_stop")
+
+    def link_status(self):
+        return self.call("link_status")
+
+    # I2C, monitors
+    def read_i2c_block(self, page, address, length):
+        return self.call("read_i2c_block", page, address, length)
+
+    def read_ddm(self):
+        return self.call("read_ddm")
+
+    def read_pre_fec_ber_INPHI(self):
+        return self.call("read_pre_fec_ber_INPHI")
+
+    def read_pre_fec_ber_Eopto(self):
+        return self.call("read_pre_fec_ber_Eopto")
+
+    def read_soak_sample(self):
+        return self.call("read_soak_sample")
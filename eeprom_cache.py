@@ -0,0 +1,105 @@
+"""
+========================================================================================================================
+# Information
+Cache of the static QSFP upper page 00h (SFF-8636), in memory and optionally in a JSON file, keyed by module serial
+number. The serial number (bytes 196-211) and the checksums of upper page 00h, CC_BASE (byte 191, sum of bytes
+128-190) and CC_EXT (byte 223, sum of bytes 192-222, which includes the serial number and date code), identify the
+module: a cached module is recognised with one 33 register read (191-223) instead of a 128 register page read.
+
+    cache = EepromCache("eeprom_cache.json")
+    page_00h = a.i2c_read_page_qsfp(0, cache=cache)
+========================================================================================================================
+"""
+
+import json
+import os
+
+
+def page_checksum(data, first, last):
+    """return: SFF-8636 check code, low 8 bits of the sum of the registers first..last (addresses 128-255)"""
+    return sum(data[first - 128 : last - 128 + 1]) & 0xFF
+
+
+class EepromCache:
+    """Static QSFP upper page 00h keyed by serial number, validated with CC_BASE/CC_EXT"""
+
+    cc_base_address = 191
+    cc_ext_address = 223
+    serial_address = 196
+    serial_length = 16
+    # Upper pages served from the cache. Only page 00h is covered by the check codes; pages 01h-03h are not (02h is
+    # user writable EEPROM, 03h holds writable thresholds) and are always read, like the lower page and vendor pages
+    static_pages = (0,)
+
+    def __init__(self, path=None):
+        """:param path: JSON file to keep the pages between script runs, None keeps them in memory only"""
+        self.path = path
+        self.modules = {}  # serial -> {"cc_base": int, "cc_ext": int, "pages": {"0": hex str}}
+        if path and os.path.exists(path):
+            with open(path) as file:
+                self.modules = json.load(file)
+        # Number of full pages read from instruments (the cost the cache saves)
+        self.page_reads = 0
+
+    def _serial(self, data, first_address):
+        """return: serial number in registers read from first_address on"""
+        first = self.serial_address - first_address
+        return data[first : first + self.serial_length].decode("ascii", "replace").strip()
+
+    def identify(self, instrument):
+        """Identify the plugged module, reading page 00h only if it is not cached
+        :param instrument: Connected Mpa2100 (or anything with read_i2c_block)
+        :return: serial number
+        """
+        # CC_BASE, the serial number and CC_EXT in one block. The 8 bit check codes alone do not tell modules apart,
+        # e.g. serial numbers with the same digits in another order have the same sums
+        data = instrument.read_i2c_block(0, self.cc_base_address, self.cc_ext_address - self.cc_base_address + 1)
+        cc_base = data[0]
+        cc_ext = data[self.cc_ext_address - self.cc_base_address]
+        serial = self._serial(data, self.cc_base_address)
+        module = self.modules.get(serial)
+        if module is None or module["cc_base"] != cc_base or module["cc_ext"] != cc_ext:
+            self.page_reads += 1
+            serial = self._store_page_00h(instrument.read_i2c_block(0, 128, 128))
+        return serial
+
+    def _store_page_00h(self, data):
+        """Check the page against its own check codes and add the module, return: serial number"""
+        cc_base = page_checksum(data, 128, 190)
+        cc_ext = page_checksum(data, 192, 222)
+        if cc_base != data[self.cc_base_address - 128] or cc_ext != data[self.cc_ext_address - 128]:
+            raise ValueError("Page 00h check code mismatch, the page was not read correctly")
+        serial = self._serial(data, 128)
+        self.modules[serial] = {"cc_base": cc_base, "cc_ext": cc_ext, "pages": {"0": data.hex()}}
+        self._save()
+        return serial
+
+    def read_page(self, instrument, page):
+        """return: upper page (registers 128-255) as bytes, from the cache if the module is known"""
+        if page not in self.static_pages:
+            self.page_reads += 1
+            return instrument.read_i2c_block(page, 128, 128)
+
+        serial = self.identify(instrument)
+        pages = self.modules[serial]["pages"]
+        if str(page) in pages:
+            return bytes.fromhex(pages[str(page)])
+
+        self.page_reads += 1
+        data = instrument.read_i2c_block(page, 128, 128)
+        pages[str(page)] = data.hex()
+        self._save()
+        return data
+
+    def invalidate(self, serial=None):
+        """Forget one module, or all modules if serial is None"""
+        if serial is None:
+            self.modules.clear()
+        else:
+            self.modules.pop(serial, None)
+        self._save()
+
+    def _save(self):
+        if self.path:
+            with open(self.path, "w") as file:
+                json.dump(self.modules, file, indent=1)
@@ -0,0 +1,125 @@
+"""
+========================================================================================================================
+# Information
+Incremental reader of the test event log (:SENSe:DATA? STRING:TEST:EVENT:LOG). The instrument returns the whole log
+on every query; the tail remembers how much of it was consumed and parses only the lines added since, into Event
+records kept in a fixed size ring buffer. Events pushed out of the buffer can be spilled to a JSON lines file, so the
+memory and the parsing per poll stay constant over a multi-day run.
+
+Only complete lines are consumed: the text after the last newline (a line still being written, or the last line of a
+log without a trailing newline) is parsed once a newline follows it. A log that got shorter or no longer ends the
+consumed part with the same text (test restart) is read from the start.
+
+    tail = EventLogTail(a, size=1000, spill="events.jsonl")
+    for event in tail.poll():
+        print(event.timestamp, event.port, event.type)
+========================================================================================================================
+"""
+
+import collections
+import datetime
+import json
+import re
+from dataclasses import asdict, dataclass
+
+# e.g. "2026-10-18 12:00:00, Port 1, Laser On" or "10/18/2026 12:00:00 P2 LOS"
+EVENT_LINE = re.compile(
+    r"\s*(?P<timestamp>\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}[ T]+\d{1,2}:\d{2}:\d{2}(?:\.\d+)?)?"
+    r"[\s,;]*(?:(?:Port|P)\s*(?P<port>\d)\b)?[\s,;:]*(?P<type>.*?)\s*$",
+    re.IGNORECASE,
+)
+TIMESTAMP_FORMATS = ("%Y-%m-%d %H:%M:%S", "%m/%d/%Y %H:%M:%S", "%d.%m.%Y %H:%M:%S", "%Y/%m/%d %H:%M:%S")
+# Length of the end of the consumed text compared on every poll, to notice a restarted log
+_MARK_LENGTH = 64
+
+
+@dataclass
+class Event:
+    """One event log line"""
+
+    timestamp: float  # epoch seconds (local time of the instrument), None if the line has none
+    type: str  # e.g. "Laser On", "LOS"
+    port: int  # 1 or 2, None if the line has none
+    text: str  # the line as read
+
+
+def parse_timestamp(text):
+    """return: epoch seconds of an event log timestamp, None if the format is unknown"""
+    text = re.sub(r"\s+|T", " ", text.strip())
+    seconds = re.search(r"\.\d+$", text)
+    if seconds:
+        text = text[: seconds.start()]
+    for pattern in TIMESTAMP_FORMATS:
+        try:
+            timestamp = datetime.datetime.strptime(text, pattern).timestamp()
+        except ValueError:
+            continue
+        return timestamp + (float(seconds.group()) if seconds else 0.0)
+    return None
+
+
+def parse_event(line):
+    """return: Event of one event log line"""
+    match = EVENT_LINE.match(line)
+    timestamp = parse_timestamp(match.group("timestamp")) if match.group("timestamp") else None
+    port = int(match.group("port")) if match.group("port") else None
+    return Event(timestamp, match.group("type"), port, line.strip())
+
+
+class EventLogTail:
+    """Poll the event log of an instrument, parse the new lines only"""
+
+    def __init__(self, instrument, size=10000, spill=None):
+        """
+        :param instrument: Connected Mpa2100 with the application selected (anything with read_event_log)
+        :param size: Number of events kept in memory
+        :param spill: JSON lines file the events pushed out of the buffer are appended to, None drops them
+        """
+        self.instrument = instrument
+        self.events = collections.deque(maxlen=size)
+        self.spill = spill
+        self._spill_file = None
+        self.offset = 0  # characters of the log consumed
+        self.mark = ""  # the last consumed characters, see _MARK_LENGTH
+        self.total = 0  # events parsed since the start, including spilled and dropped ones
+        self.restarts = 0
+
+    def poll(self):
+        """Read the log, return: list of the events added since the last poll"""
+        return self.feed(self.instrument.read_event_log())
+
+    def feed(self, log):
+        """Consume a full event log text, return: list of the new events"""
+        if len(log) < self.offset or not log.startswith(self.mark, self.offset - len(self.mark)):
+            self.offset = 0
+            self.restarts += 1
+        # Complete lines only, a line still being written is parsed by a later poll
+        end = log.rfind("\n") + 1
+        if end <= self.offset:
+            return []
+        new = log[self.offset : end]
+        self.offset = end
+        self.mark = log[max(end - _MARK_LENGTH, 0) : end]
+
+        events = [parse_event(line) for line in new.splitlines() if line.strip()]
+        for event in events:
+            if self.spill and len(self.events) == self.events.maxlen:
+                self._write_spill(self.events[0])
+            self.events.append(event)
+        self.total += len(events)
+        return events
+
+    def _write_spill(self, event):
+        if self._spill_file is None:
+            self._spill_file = open(self.spill, "a")
+        self._spill_file.write(json.dumps(asdict(event)) + "\n")
+
+    def close(self):
+        """Spill the buffered events too and close the spill file"""
+        if self.spill:
+            for event in self.events:
+                self._write_spill(event)
+            self.events.clear()
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
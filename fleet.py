@@ -0,0 +1,193 @@
+"""
+========================================================================================================================
+# Information
+Sample many MTS/MPA instruments in parallel. Each target is a (host, application) pair, e.g.
+("10.10.10.20", "TermEth100GL2Traffic_101"), and gets its own AsyncMpa2100 connection. All targets are polled at a
+fixed period and the samples are merged into one timestamped stream. A slow or dead target never delays the others:
+its poll is bounded by a timeout, it is skipped while a previous poll is still running and it is reconnected on the
+next period after an error.
+
+    python fleet.py 10.10.10.20:TermEth100GL2Traffic_101 10.10.40.197:TermEth40GL2Traffic_102 --period 5
+========================================================================================================================
+"""
+
+import argparse
+import asyncio
+import time
+
+from viavi_async import AsyncMpa2100
+
+
+class FleetPoller:
+    """Poll a configured set of readings from many instruments at a fixed period"""
+
+    # name -> query, read with one compound command per target and period
+    default_readings = {
+        "rx_power": AsyncMpa2100.SCPI_cmd_read_rx_QSFP,
+        "time_elapsed": AsyncMpa2100.SCPI_cmd_time_elapsed,
+        "error_seconds": AsyncMpa2100.SCPI_cmd_error_seconds,
+    }
+
+    def __init__(self, targets, readings=None, period=5.0, workers=8, timeout=5.0, port=8000):
+        """
+        :param targets: List of (host, application), e.g. [("10.10.10.20", "TermEth100GL2Traffic_101")]
+        :param readings: Dict name -> query, default rx_power, time_elapsed and error_seconds
+        :param period: Sample period in seconds
+        :param workers: Max number of targets connecting or polling at the same time
+        :param timeout: Upper bound in seconds for one connect or poll
+        :param port: Base port of the instruments
+        """
+        self.targets = [tuple(target) for target in targets]
+        self.readings = dict(readings or self.default_readings)
+        self.period = period
+        self.workers = workers
+        self.timeout = timeout
+        self.port = port
+        self.instruments = {}
+        # target -> {"count", "errors", "latency_total", "latency_max"}
+        self.stats = {target: {"count": 0, "errors": 0, "latency_total": 0.0, "latency_max": 0.0}
+                      for target in self.targets}
+
+    async def _connect(self, target):
+        host, application = target
+        instrument = AsyncMpa2100(port=self.port, timeout=self.timeout)
+        try:
+            await instrument.connect(host)
+            await instrument.select_application(application)
+            await instrument.remote_session_start()
+        except BaseException:
+            # Also on cancellation by the wait_for timeout in _poll: the connection may be open already
+            if instrument.writer is not None:
+                instrument.writer.close()
+            raise
+        self.instruments[target] = instrument
+        return instrument
+
+    async def _poll(self, target, semaphore):
+        """return: one sample dict for the target, "error" is set instead of raising"""
+        host, application = target
+        sample = {"time": time.time(), "host": host, "application": application, "values": None, "error": None}
+        start = time.monotonic()
+        async with semaphore:
+            try:
+                instrument = self.instruments.get(target)
+                if instrument is None:
+                    instrument = await asyncio.wait_for(self._connect(target), self.timeout)
+                values = await asyncio.wait_for(
+                    instrument.query_many(self.readings.values()), self.timeout
+                )
+                sample["values"] = dict(zip(self.readings, values))
+            except Exception as error:  # a broken target must not stop the fleet
+                sample["error"] = f"{type(error).__name__}: {error}"
+                await self._drop(target)
+        sample["latency"] = time.monotonic() - start
+
+        stats = self.stats[target]
+        stats["count"] += 1
+        stats["errors"] += sample["error"] is not None
+        stats["latency_total"] += sample["latency"]
+        stats["latency_max"] = max(stats["latency_max"], sample["latency"])
+        return sample
+
+    async def _drop(self, target):
+        """Forget a broken connection, it is reconnected at the next poll"""
+        instrument = self.instruments.pop(target, None)
+        if instrument is not None and instrument.writer is not None:
+            instrument.writer.close()
+
+    async def samples(self, count=None):
+        """Async generator of merged samples, in order of arrival
+        :param count: Number of periods to run, None runs forever
+        """
+        semaphore = asyncio.Semaphore(self.workers)
+        queue = asyncio.Queue()
+        running = {}
+
+        def schedule():
+            for target in self.targets:
+                # A target still busy with the previous period is skipped, not queued up
+                if target in running and not running[target].done():
+                    continue
+                task = asyncio.ensure_future(self._poll(target, semaphore))
+                task.add_done_callback(lambda done: done.cancelled() or queue.put_nowait(done.result()))
+                running[target] = task
+
+        start = time.monotonic()
+        period_no = 0
+        try:
+            while count is None or period_no < count:
+                schedule()
+                period_no += 1
+                deadline = start + period_no * self.period
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        yield await asyncio.wait_for(queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+            # Drain the last period
+            pending = [task for task in running.values() if not task.done()]
+            if pending:
+                await asyncio.wait(pending)
+            while not queue.empty():
+                yield queue.get_nowait()
+        finally:
+            for task in running.values():
+                task.cancel()
+            for target in list(self.instruments):
+                await self._drop(target)
+
+    def latency_report(self):
+        """return: dict target -> {"count", "errors", "latency_mean", "latency_max"}"""
+        report = {}
+        for target, stats in self.stats.items():
+            report[target] = {
+                "count": stats["count"],
+                "errors": stats["errors"],
+                "latency_mean": stats["latency_total"] / stats["count"] if stats["count"] else None,
+                "latency_max": stats["latency_max"],
+            }
+        return report
+
+    def run(self, callback, count=None):
+        """Blocking helper, call ``callback(sample)`` for each sample"""
+
+        async def consume():
+            async for sample in self.samples(count):
+                callback(sample)
+
+        asyncio.run(consume())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sample many VIAVI instruments in parallel")
+    parser.add_argument("targets", nargs="+", help="host:application, e.g. 10.10.10.20:TermEth100GL2Traffic_101")
+    parser.add_argument("--period", type=float, default=5.0)
+    parser.add_argument("--count", type=int, default=None, help="number of periods (default: forever)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=5.0)
+    args = parser.parse_args()
+
+    poller = FleetPoller(
+        [target.split(":", 1) for target in args.targets],
+        period=args.period,
+        workers=args.workers,
+        timeout=args.timeout,
+    )
+
+    def show(sample):
+        result = sample["error"] if sample["error"] else ",".join(str(v) for v in sample["values"].values())
+        print(f'{sample["time"]:.3f},{sample["host"]},{sample["application"]},{sample["latency"]:.3f},{result}')
+
+    try:
+        poller.run(show, args.count)
+    except KeyboardInterrupt:
+        pass
+    for (host, application), stats in poller.latency_report().items():
+        print(f"{host} {application}: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,8 +13,8 @@ a.remote_session_start()
 
 
 for i in range(10):
-    a.read_pre_fec_ber_INPHI()
-    #a.read_pre_fec_ber_Eopto()
+    print(a.read_pre_fec_ber_INPHI())
+    #print(a.read_pre_fec_ber_Eopto())
     time.sleep(0.5)
 
 
@@ -0,0 +1,193 @@
+"""
+========================================================================================================================
+# Information
+Per command metrics of the SCPI transport: round trips, latency histogram, timeouts, SCPI error codes and bytes on
+the wire, keyed by host and command mnemonic (arguments removed, e.g. ":SENSE:EXPERT:I2C:PEEK:REGADDR").
+Readable in-process (snapshot) and exportable as JSON or Prometheus text (node exporter textfile collector).
+
+Disabled by default: the clients then only test one attribute per round trip.
+
+    metrics = Metrics(enabled=True)
+    a = viavi.Mpa2100(metrics=metrics)
+    ...
+    metrics.write_prometheus("/var/lib/node_exporter/viavi.prom")
+    print(metrics.snapshot())
+========================================================================================================================
+"""
+
+import bisect
+import functools
+import json
+import os
+import threading
+
+from scpi import DATA_QUERY, ERROR_QUERY
+
+# Upper bounds of the latency histogram buckets in seconds (+Inf is implicit)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+@functools.lru_cache(maxsize=1024)
+def mnemonic(command):
+    """return: command without arguments, :SYSTem:ERRor? checks left out of compound commands
+    e.g. ":SENSE:EXPERT:I2C:PEEK:REGADDR 182 ;:SYSTem:ERRor?" -> ":SENSE:EXPERT:I2C:PEEK:REGADDR"
+    """
+    parts = []
+    for part in command.split(";"):
+        words = part.split()
+        if not words:
+            continue
+        if DATA_QUERY.match(words[0]) and len(words) > 1:
+            parts.append(f":SENSE:DATA? {words[1].upper()}")
+        else:
+            parts.append(words[0].upper())
+    checks = [part for part in parts if not ERROR_QUERY.match(part)]
+    return ";".join(checks or parts)
+
+
+class Metrics:
+    """Thread safe metrics store, shared by any number of clients"""
+
+    def __init__(self, enabled=False, buckets=BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.commands = {}  # (host, mnemonic) -> dict, see _entry
+
+    def _entry(self, host, command):
+        key = (host, mnemonic(command))
+        entry = self.commands.get(key)
+        if entry is None:
+            entry = {
+                "count": 0,
+                "latency_sum": 0.0,
+                "latency_max": 0.0,
+                "buckets": [0] * (len(self.buckets) + 1),
+                "timeouts": 0,
+                "errors": {},
+                "bytes_sent": 0,
+                "bytes_received": 0,
+            }
+            self.commands[key] = entry
+        return entry
+
+    def observe(self, host, command, duration, sent, received, timeout=False):
+        """Count one round trip
+        :param duration: Seconds from write until the last reply field (or the timeout)
+        :param sent: Bytes written
+        :param received: Reply bytes
+        :param timeout: The reply did not arrive in time
+        """
+        with self.lock:
+            entry = self._entry(host, command)
+            entry["count"] += 1
+            entry["latency_sum"] += duration
+            entry["latency_max"] = max(entry["latency_max"], duration)
+            entry["buckets"][bisect.bisect_left(self.buckets, duration)] += 1
+            entry["timeouts"] += timeout
+            entry["bytes_sent"] += sent
+            entry["bytes_received"] += received
+
+    def error(self, host, command, code):
+        """Count an SCPI error code reported for a command"""
+        with self.lock:
+            errors = self._entry(host, command)["errors"]
+            errors[code] = errors.get(code, 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.commands.clear()
+
+    def snapshot(self):
+        """return: list of dicts, one per host and command, with the counters and the cumulative histogram"""
+        with self.lock:
+            result = []
+            for (host, command), entry in sorted(self.commands.items(), key=lambda item: (str(item[0][0]), item[0][1])):
+                cumulative = []
+                total = 0
+                for bound, count in zip(self.buckets + (float("inf"),), entry["buckets"]):
+                    total += count
+                    cumulative.append([bound, total])
+                result.append(
+                    {
+                        "host": host,
+                        "command": command,
+                        "count": entry["count"],
+                        "latency_sum": entry["latency_sum"],
+                        "latency_mean": entry["latency_sum"] / entry["count"] if entry["count"] else None,
+                        "latency_max": entry["latency_max"],
+                        "histogram": cumulative,
+                        "timeouts": entry["timeouts"],
+                        "errors": {str(code): count for code, count in entry["errors"].items()},
+                        "bytes_sent": entry["bytes_sent"],
+                        "bytes_received": entry["bytes_received"],
+                    }
+                )
+            return result
+
+    def to_json(self):
+        # json has no Infinity, the last bucket bound is written as "+Inf"
+        snapshot = self.snapshot()
+        for entry in snapshot:
+            entry["histogram"][-1][0] = "+Inf"
+        return json.dumps(snapshot, indent=1)
+
+    def to_prometheus(self):
+        """return: metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        snapshot = self.snapshot()
+        labels = {id(entry): _labels(host=entry["host"], command=entry["command"]) for entry in snapshot}
+
+        family("viavi_scpi_latency_seconds", "histogram", "SCPI round trip latency")
+        for entry in snapshot:
+            for bound, count in entry["histogram"]:
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'viavi_scpi_latency_seconds_bucket{{{labels[id(entry)]},le="{le}"}} {count}')
+            lines.append(f"viavi_scpi_latency_seconds_sum{{{labels[id(entry)]}}} {entry['latency_sum']!r}")
+            lines.append(f"viavi_scpi_latency_seconds_count{{{labels[id(entry)]}}} {entry['count']}")
+
+        for name, key, help_text in (
+            ("viavi_scpi_timeouts_total", "timeouts", "SCPI replies that did not arrive in time"),
+            ("viavi_scpi_bytes_sent_total", "bytes_sent", "Bytes written to the instrument"),
+            ("viavi_scpi_bytes_received_total", "bytes_received", "Reply bytes read from the instrument"),
+        ):
+            family(name, "counter", help_text)
+            for entry in snapshot:
+                lines.append(f"{name}{{{labels[id(entry)]}}} {entry[key]}")
+
+        family("viavi_scpi_errors_total", "counter", "SCPI error codes reported by :SYSTem:ERRor?")
+        for entry in snapshot:
+            for code, count in entry["errors"].items():
+                lines.append(f'viavi_scpi_errors_total{{{labels[id(entry)]},code="{code}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Write the Prometheus text atomically (the textfile collector never reads a partial file)"""
+        _write_atomic(path, self.to_prometheus())
+
+    def write_json(self, path):
+        _write_atomic(path, self.to_json())
+
+
+def _labels(**labels):
+    """return: Prometheus label string, e.g. host="10.10.10.20",command=":OUTPUT:OPTIC" """
+    escaped = {
+        name: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for name, value in labels.items()
+    }
+    return ",".join(f'{name}="{value}"' for name, value in escaped.items())
+
+
+def _write_atomic(path, text):
+    with open(path + ".tmp", "w") as file:
+        file.write(text)
+    os.replace(path + ".tmp", path)
+
+
+# Used by clients created without metrics, disabled until enabled = True
+default_metrics = Metrics()
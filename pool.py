@@ -0,0 +1,235 @@
+"""
+========================================================================================================================
+# Information
+Managed connections for long soak tests. ManagedMpa2100 reconnects when the telnet session drops and re-applies
+*REM, the remote operational mode, the selected application and the remote session. Reconnect attempts back off
+exponentially so a flapping instrument is not hammered. ConnectionPool hands out reusable sessions per host and
+application and keeps idle sessions alive with a cheap :SYSTem:ERRor? query.
+
+    pool = ConnectionPool()
+    with pool.acquire("10.10.40.197", "TermEth100GL2Traffic_101") as instrument:
+        instrument.read_soak_sample()
+========================================================================================================================
+"""
+
+import contextlib
+import logging
+import random
+import threading
+import time
+
+from viavi import Mpa2100, count_queries
+
+logger = logging.getLogger(__name__)
+
+
+class ManagedMpa2100(Mpa2100):
+    """Mpa2100 with transparent reconnect and backoff"""
+
+    # Commands that are safe to send again after a reconnect, besides pure queries
+    idempotent_cmds = (
+        Mpa2100.SCPI_cmd_select_app,
+        Mpa2100.SCPI_cmd_i2c_peek_pagesel,
+        Mpa2100.SCPI_cmd_i2c_peek_regaddr,
+        Mpa2100.SCPI_cmd_i2c_peek_trigger,
+    )
+
+    def __init__(
+        self,
+        port=8000,
+        timeout=30,
+        port_cache=None,
+        backoff_min=1.0,
+        backoff_max=60.0,
+        retries=5,
+        validate=True,
+        metrics=None,
+        transport=None,
+    ):
+        """
+        :param backoff_min: First wait in seconds between reconnect attempts, doubled per failed attempt
+        :param backoff_max: Upper bound of the wait between reconnect attempts
+        :param retries: Reconnect attempts before giving up with ConnectionError
+        """
+        super().__init__(
+            port=port, timeout=timeout, port_cache=port_cache, validate=validate, metrics=metrics, transport=transport
+        )
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.retries = retries
+        self.last_used = time.monotonic()
+        self.reconnects = 0
+        self._reconnecting = False
+        self._failures = 0
+        self._next_attempt = 0.0
+
+    def _is_idempotent(self, command):
+        """return: True if the command can be re-sent without changing the instrument twice (e.g. no toggle)"""
+        for part in command.split(";"):
+            part = part.strip()
+            if part and not (count_queries(part) or part.startswith(self.idempotent_cmds)):
+                return False
+        return True
+
+    def _query(self, command, timeout=5):
+        try:
+            fields = super()._query(command, timeout)
+        except TimeoutError:
+            # A missing reply, not a lost connection (TimeoutError is an OSError): read_fields drained the late
+            # part of the reply, the session stays as it is
+            raise
+        except (OSError, EOFError) as error:
+            if self._reconnecting:
+                raise
+            logger.warning("%s: connection lost (%r), reconnecting", self.host, error)
+            self.reconnect()
+            if not self._is_idempotent(command):
+                raise ConnectionError(f"Reconnected to {self.host}, '{command}' was not re-sent") from error
+            fields = super()._query(command, timeout)
+        self.last_used = time.monotonic()
+        return fields
+
+    def read_i2c_block(self, page, address, length):
+        try:
+            return super().read_i2c_block(page, address, length)
+        except TimeoutError:
+            raise
+        except (OSError, EOFError) as error:
+            logger.warning("%s: connection lost (%r), reconnecting", self.host, error)
+            self.reconnect()
+            return super().read_i2c_block(page, address, length)
+
+    def _backoff(self):
+        """return: seconds to wait before the next reconnect attempt (exponential with jitter)"""
+        delay = min(self.backoff_max, self.backoff_min * 2 ** max(self._failures - 1, 0))
+        return delay * random.uniform(0.5, 1.0)
+
+    def reconnect(self):
+        """Open a new connection and re-apply *REM, remote mode, application and remote session"""
+        attempts = 0
+        while True:
+            wait = self._next_attempt - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                self._restore()
+            except (OSError, EOFError) as error:
+                self._failures += 1
+                self._next_attempt = time.monotonic() + self._backoff()
+                attempts += 1
+                if attempts >= self.retries:
+                    raise ConnectionError(f"Reconnect to {self.host} failed {attempts} times") from error
+                logger.warning("%s: reconnect failed (%r), next attempt in %.1fs", self.host, error,
+                               self._next_attempt - time.monotonic())
+            else:
+                self._failures = 0
+                self.reconnects += 1
+                return
+
+    def _restore(self):
+        with contextlib.suppress(Exception):
+            self.tn.close()
+        remote_visible, application, session_started = self.remote_visible, self.application, self.session_started
+        self._reconnecting = True
+        try:
+            # The cached port is validated first and discovered again if the module moved
+            self.connect(self.host)
+            if remote_visible:
+                self.remote_operational_mode()
+            if application:
+                self.select_application(application)
+            if session_started:
+                self.remote_session_start()
+        finally:
+            self._reconnecting = False
+
+    def keepalive(self, idle=60.0):
+        """Send :SYSTem:ERRor? if the connection was idle for ``idle`` seconds (reconnects if it dropped)"""
+        if time.monotonic() - self.last_used >= idle:
+            self._query(self.SCPI_cmd_sys_error)
+
+
+class ConnectionPool:
+    """Reusable ManagedMpa2100 sessions per (host, application)"""
+
+    def __init__(self, port=8000, timeout=30, keepalive=60.0, **managed_kwargs):
+        """
+        :param keepalive: Idle seconds before a pooled session is pinged by keepalive()
+        :param managed_kwargs: Passed on to ManagedMpa2100, e.g. backoff_min, backoff_max, retries
+        """
+        self.port = port
+        self.timeout = timeout
+        self.keepalive_idle = keepalive
+        self.managed_kwargs = managed_kwargs
+        self.idle = {}  # (host, application) -> list of free sessions
+        self.lock = threading.Lock()
+        self._keepalive_thread = None
+        self._stop = threading.Event()
+
+    def _create(self, host, application):
+        instrument = ManagedMpa2100(port=self.port, timeout=self.timeout, **self.managed_kwargs)
+        instrument.connect(host)
+        if application:
+            instrument.select_application(application)
+            instrument.remote_session_start()
+        return instrument
+
+    @contextlib.contextmanager
+    def acquire(self, host, application=None):
+        """Context manager, yields an exclusive session and returns it to the pool afterwards; a session left by an
+        exception is closed instead, its state (stream, application, session) is unknown
+        """
+        key = (host, application)
+        with self.lock:
+            sessions = self.idle.get(key)
+            instrument = sessions.pop() if sessions else None
+        if instrument is None:
+            instrument = self._create(host, application)
+        healthy = False
+        try:
+            yield instrument
+            healthy = True
+        finally:
+            if healthy:
+                with self.lock:
+                    self.idle.setdefault(key, []).append(instrument)
+            else:
+                with contextlib.suppress(Exception):
+                    instrument.close()
+
+    def keepalive(self):
+        """Ping the idle sessions that has not been used for ``keepalive`` seconds, drop the ones that fail"""
+        # Take the idle sessions out of the pool, a slow reconnect must not block acquire()
+        with self.lock:
+            idle = [(key, instrument) for key, sessions in self.idle.items() for instrument in sessions]
+            self.idle = {}
+        for key, instrument in idle:
+            try:
+                instrument.keepalive(self.keepalive_idle)
+            except (ConnectionError, OSError, EOFError) as error:
+                logger.warning("%s: dropping idle session (%r)", key, error)
+                continue
+            with self.lock:
+                self.idle.setdefault(key, []).append(instrument)
+
+    def start_keepalive(self, interval=None):
+        """Run keepalive() from a daemon thread every ``interval`` seconds (default: the keepalive idle time)"""
+        interval = interval or self.keepalive_idle
+
+        def run():
+            while not self._stop.wait(interval):
+                self.keepalive()
+
+        self._stop.clear()
+        self._keepalive_thread = threading.Thread(target=run, name="viavi-keepalive", daemon=True)
+        self._keepalive_thread.start()
+
+    def close(self):
+        """Stop the keepalive thread and close all idle sessions"""
+        self._stop.set()
+        with self.lock:
+            for sessions in self.idle.values():
+                for instrument in sessions:
+                    with contextlib.suppress(Exception):
+                        instrument.close()
+            self.idle.clear()
@@ -0,0 +1,299 @@
+"""
+========================================================================================================================
+# Information
+Columnar binary time-series store for measurement logs.
+
+File layout (little endian):
+    header  b"VIAVIREC", u32 version, u32 schema length, JSON schema padded to 8 bytes
+    chunk   b"CHNK", u32 rows, u32 payload length, u32 crc32(payload), payload
+    payload one contiguous array per column (rows * item size), each padded to 8 bytes
+
+Every column of every chunk is an aligned, contiguous array, so a file is read zero-copy with np.frombuffer on a
+memory map. A chunk is only valid with its full payload and a matching CRC: a chunk cut short by a crash is ignored
+by the reader and truncated when the file is opened again for appending.
+
+    with Recorder("soak.rec", [("host_time", "f8"), ("rx_power", "f8"), ("rx_power_lanes", "f4", 4)]) as rec:
+        rec.append({"host_time": time.time(), "rx_power": 3.8, "rx_power_lanes": [1.1, 1.0, 0.9, 1.2]})
+    columns = read_columns("soak.rec")
+========================================================================================================================
+"""
+
+import argparse
+import json
+import mmap
+import os
+import re
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b"VIAVIREC"
+VERSION = 1
+CHUNK_MAGIC = b"CHNK"
+FILE_HEADER = struct.Struct("<8sII")
+CHUNK_HEADER = struct.Struct("<4sIII")
+ALIGN = 8
+
+
+def _padding(length):
+    return -length % ALIGN
+
+
+def _dtypes(columns):
+    """return: list of (name, numpy dtype) from schema entries (name, dtype) or (name, dtype, lanes)"""
+    result = []
+    for column in columns:
+        name, dtype = column[0], np.dtype(column[1])
+        if len(column) > 2:
+            dtype = np.dtype((dtype, tuple(np.atleast_1d(column[2]))))
+        result.append((name, dtype))
+    return result
+
+
+def _read_header(buffer):
+    """return: (schema list, offset of the first chunk)"""
+    if len(buffer) < FILE_HEADER.size:
+        raise ValueError("Not a recorder file (too short)")
+    magic, version, schema_length = FILE_HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a recorder file (magic {magic!r}, version {version})")
+    start = FILE_HEADER.size
+    schema = json.loads(bytes(buffer[start : start + schema_length]).decode("ascii"))
+    return schema, start + schema_length + _padding(start + schema_length)
+
+
+def _scan_chunks(buffer, offset):
+    """Yield (payload offset, rows, payload length) of the valid chunks, stop at the first incomplete or corrupt chunk"""
+    while offset + CHUNK_HEADER.size <= len(buffer):
+        magic, rows, length, crc = CHUNK_HEADER.unpack_from(buffer, offset)
+        start = offset + CHUNK_HEADER.size
+        if magic != CHUNK_MAGIC or start + length > len(buffer):
+            return
+        if zlib.crc32(buffer[start : start + length]) != crc:
+            return
+        yield start, rows, length
+        offset = start + length
+
+
+class Recorder:
+    """Append typed rows to a chunked columnar file"""
+
+    def __init__(self, path, columns, chunk_rows=1024, sync=False, mode="a"):
+        """
+        :param path: Output file
+        :param columns: List of (name, dtype) or (name, dtype, lanes), e.g. ("rx_power_lanes", "f4", 4)
+        :param chunk_rows: Rows buffered in memory before a chunk is written
+        :param sync: os.fsync after every chunk (survives power loss, slower)
+        :param mode: "a" appends to an existing file with the same schema (e.g. continue after a crash), "w" overwrites
+        """
+        if mode not in ("a", "w"):
+            raise ValueError(f"mode must be 'a' or 'w', not {mode!r}")
+        self.path = path
+        self.schema = [list(column) for column in columns]
+        self.dtypes = _dtypes(self.schema)
+        self.chunk_rows = chunk_rows
+        self.sync = sync
+        self.rows = []
+
+        if mode == "a" and os.path.exists(path) and os.path.getsize(path) > 0:
+            self.file = open(path, "r+b")
+            self._recover()
+        else:
+            self.file = open(path, "wb")
+            schema = json.dumps(self.schema).encode("ascii")
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION, len(schema)) + schema)
+            self.file.write(b"\0" * _padding(FILE_HEADER.size + len(schema)))
+            self.file.flush()
+
+    def _recover(self):
+        """Check the schema of an existing file and cut off a partly written last chunk"""
+        buffer = self.file.read()
+        schema, offset = _read_header(buffer)
+        if schema != json.loads(json.dumps(self.schema)):
+            raise ValueError(f"{self.path} has another schema: {schema}")
+        end = offset
+        for start, rows, length in _scan_chunks(buffer, offset):
+            end = start + length
+        self.file.truncate(end)
+        self.file.seek(end)
+
+    def append(self, row):
+        """Add one row, a dict by column name or a sequence in column order"""
+        if isinstance(row, dict):
+            row = [row[name] for name, dtype in self.dtypes]
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows as one chunk"""
+        if not self.rows:
+            return
+        payload = bytearray()
+        for index, (name, dtype) in enumerate(self.dtypes):
+            # Base type + reshape, np.array with a sub-array dtype would broadcast every lane value
+            column = np.array([row[index] for row in self.rows], dtype=dtype.base)
+            column = column.reshape((len(self.rows),) + dtype.shape)
+            data = column.tobytes()
+            payload += data + b"\0" * _padding(len(data))
+        self.file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, len(self.rows), len(payload), zlib.crc32(payload)))
+        self.file.write(payload)
+        self.file.flush()
+        if self.sync:
+            os.fsync(self.file.fileno())
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RecordFile:
+    """Memory-mapped, read-only view of a recorder file"""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.schema, offset = _read_header(self.buffer)
+        self.dtypes = _dtypes(self.schema)
+        self.chunk_offsets = list(_scan_chunks(self.buffer, offset))
+
+    def __len__(self):
+        return sum(rows for start, rows, length in self.chunk_offsets)
+
+    def chunks(self):
+        """Yield one dict name -> array per chunk, the arrays are zero-copy views of the memory map"""
+        for start, rows, length in self.chunk_offsets:
+            offset = start
+            chunk = {}
+            for name, dtype in self.dtypes:
+                chunk[name] = np.frombuffer(self.buffer, dtype=dtype, count=rows, offset=offset)
+                offset += rows * dtype.itemsize + _padding(rows * dtype.itemsize)
+            yield chunk
+
+    def column(self, name):
+        """return: the whole column as one array (zero-copy if the file has a single chunk)"""
+        parts = [chunk[name] for chunk in self.chunks()]
+        if len(parts) == 1:
+            return parts[0]
+        dtype = dict(self.dtypes)[name]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+    def close(self):
+        self.buffer.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_columns(path):
+    """return: dict name -> array with all rows of a recorder file (copied, the file is closed)"""
+    with RecordFile(path) as record:
+        return {name: np.array(record.column(name)) for name, dtype in record.dtypes}
+
+
+def _csv_row(line, columns):
+    """return: the first ``columns`` fields of a CSV line as floats, NaN for missing or non-numeric fields"""
+    fields = line.rstrip("\n").split(",")[:columns]
+    row = []
+    for field in fields + [""] * (columns - len(fields)):
+        try:
+            row.append(float(field))
+        except ValueError:
+            row.append(float("nan"))
+    return row
+
+
+def _csv_header(csv_file):
+    """Read the header of a soak CSV (e.g. data.txt: Rx_power,time_elapsed,err seconds)
+    A first sample written on the header line (missing newline after the header) is recovered.
+    :return: (column names as identifiers, number of columns, first data lines)
+    """
+    header = csv_file.readline().rstrip("\n").split(",")
+    first = csv_file.readline()
+    columns = len(first.split(",")) if first.strip() else len(header)
+    names = header[:columns]
+    glued = header[columns:]
+    if glued:
+        # e.g. "err seconds3.81765" -> name "err seconds", first value "3.81765"
+        match = re.match(r"(.*?[^\d.+-])([-+]?\d[\d.eE+-]*)$", names[-1])
+        if match is None:
+            raise ValueError(f"Header has more fields than the data rows: {','.join(header)}")
+        names[-1] = match.group(1)
+        glued = [match.group(2)] + glued
+
+    names = [re.sub(r"\W+", "_", name.strip()) for name in names]
+    lines = ([",".join(glued)] if glued else []) + [first]
+    return names, columns, [line for line in lines if line.strip()]
+
+
+def _csv_block(lines, columns):
+    """return: float64 array (rows, columns) of CSV lines, NaN for missing or non-numeric fields"""
+    try:
+        # Fast path: all lines complete and numeric
+        values = np.array(",".join(line.strip() for line in lines).split(","), dtype=np.float64)
+        if values.size == len(lines) * columns:
+            return values.reshape(len(lines), columns)
+    except ValueError:
+        pass
+    return np.array([_csv_row(line, columns) for line in lines], dtype=np.float64).reshape(len(lines), columns)
+
+
+def csv_chunks(csv_path, chunk_rows=65536):
+    """Stream a soak CSV as chunks like RecordFile.chunks, memory is bounded by chunk_rows
+    :return: generator of dicts name -> float64 array
+    """
+    with open(csv_path) as csv_file:
+        names, columns, lines = _csv_header(csv_file)
+        for line in csv_file:
+            if line.strip():
+                lines.append(line)
+            if len(lines) >= chunk_rows:
+                block = _csv_block(lines, columns)
+                yield {name: block[:, index] for index, name in enumerate(names)}
+                lines = []
+        if lines:
+            block = _csv_block(lines, columns)
+            yield {name: block[:, index] for index, name in enumerate(names)}
+
+
+def convert_csv(csv_path, out_path, chunk_rows=4096):
+    """Stream a soak CSV (e.g. data.txt: Rx_power,time_elapsed,err seconds) into a recorder file, overwritten
+    A first sample written on the header line (missing newline after the header) is recovered.
+    :return: number of rows converted
+    """
+    count = 0
+    with open(csv_path) as csv_file:
+        names, columns, lines = _csv_header(csv_file)
+        with Recorder(out_path, [(name, "f8") for name in names], chunk_rows=chunk_rows, mode="w") as recorder:
+            for line in lines:
+                recorder.append(_csv_row(line, columns))
+                count += 1
+            for line in csv_file:
+                if line.strip():
+                    recorder.append(_csv_row(line, columns))
+                    count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a soak CSV log to the columnar recorder format")
+    parser.add_argument("csv", help="CSV log, e.g. data.txt")
+    parser.add_argument("output", help="recorder file, e.g. data.rec")
+    args = parser.parse_args()
+    print(f"{convert_csv(args.csv, args.output)} rows written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+========================================================================================================================
+# Information
+Drift-free sampling for soak tests. Samples are scheduled on monotonic-clock deadlines (start + n * period), so a
+slow query does not stretch the period: the next sample still starts on its own deadline and deadlines that passed
+while a query was running are counted as missed instead of being caught up.
+
+    sampler = Sampler(lambda: dict(zip(("rx_power", "time_elapsed", "error_seconds"), a.read_soak_sample())), 5)
+    for sample in sampler.samples():
+        print(sample["host_time"], sample["instrument_time"], sample["values"], sample["missed"])
+========================================================================================================================
+"""
+
+import time
+
+
+class Sampler:
+    """Call ``read`` every ``period`` seconds on monotonic deadlines"""
+
+    def __init__(self, read, period=5.0, instrument_time_key="time_elapsed"):
+        """
+        :param read: Callable returning the values of one sample, e.g. a dict
+        :param period: Sample period in seconds
+        :param instrument_time_key: Key of the instrument timestamp (SECOND:TEST:ELAPSED) in the values, if any
+        """
+        self.read = read
+        self.period = period
+        self.instrument_time_key = instrument_time_key
+        self.missed_total = 0
+        self._stop = False
+
+    def stop(self):
+        """Stop after the sample in progress"""
+        self._stop = True
+
+    def samples(self, count=None):
+        """Generator of sample dicts:
+        index, deadline (monotonic), host_time (epoch), lateness and duration (s), missed (deadlines skipped since the
+        previous sample), instrument_time and values
+        :param count: Number of samples, None runs until stop()
+        """
+        self._stop = False
+        start = time.monotonic()
+        deadline_no = 0
+        index = 0
+        missed = 0
+        while not self._stop and (count is None or index < count):
+            deadline = start + deadline_no * self.period
+            now = time.monotonic()
+            if now < deadline:
+                time.sleep(deadline - now)
+
+            started = time.monotonic()
+            host_time = time.time()
+            values = self.read()
+            finished = time.monotonic()
+
+            instrument_time = None
+            if isinstance(values, dict):
+                instrument_time = values.get(self.instrument_time_key)
+            yield {
+                "index": index,
+                "deadline": deadline,
+                "host_time": host_time,
+                "lateness": started - deadline,
+                "duration": finished - started,
+                "missed": missed,
+                "instrument_time": instrument_time,
+                "values": values,
+            }
+            index += 1
+
+            # Next deadline in the future, the ones that passed meanwhile are flagged as missed
+            next_no = deadline_no + 1
+            due = int((time.monotonic() - start) // self.period)
+            if due >= next_no:
+                missed = due - next_no + 1
+                next_no = due + 1
+            else:
+                missed = 0
+            self.missed_total += missed
+            deadline_no = next_no
+
+    def run(self, callback, count=None):
+        """Blocking helper, call ``callback(sample)`` for each sample"""
+        for sample in self.samples(count):
+            callback(sample)
@@ -0,0 +1,163 @@
+"""
+========================================================================================================================
+# Information
+Typed parsing of SCPI replies. The type of each reply field follows from its query, so the converters of a command
+are looked up once per command string and every reply is converted in a single pass:
+    :SENSe:DATA? FLOAT:...      -> float        INTEGER:, COUNT:, SECOND:, ... -> int
+    :SENSe:DATA? CSTATUS:...    -> bool         STRING:...                      -> str without quotes
+    header queries, e.g. :OUTPUT:OPTIC? -> "ON"/"OFF" as bool, numbers as int/float, else str
+The "invalid" sentinel 9.91e+37 (no measurement yet, e.g. no link) becomes None. :SYSTem:ERRor? replies are not
+returned as values, a non zero error code raises the ScpiError subclass of its SCPI error class.
+
+    values = parse_reply(":SENSE:DATA? CSTATUS:PCS:PHY:LINK:ACTIVE ;:SYSTem:ERRor?", ["1", '0, "No error"'])  # [True]
+========================================================================================================================
+"""
+
+import functools
+import re
+
+INVALID = 9.91e37
+
+ERROR_QUERY = re.compile(r":?SYST(?:EM)?:ERR(?:OR)?\?$", re.IGNORECASE)
+DATA_QUERY = re.compile(r":?SENS(?:E)?:DATA\?$", re.IGNORECASE)
+ERROR_REPLY = re.compile(r'\s*([-+]?\d+)\s*,\s*"?(.*?)"?\s*$', re.DOTALL)
+
+
+class ScpiError(Exception):
+    """Error reported by the instrument in a :SYSTem:ERRor? reply"""
+
+    def __init__(self, code, message, command=None):
+        self.code = code
+        self.message = message
+        self.command = command
+        super().__init__(f"{code}, {message}" + (f" (command: {command})" if command else ""))
+
+
+class CommandError(ScpiError):
+    """-100..-199, e.g. -113 Undefined header"""
+
+
+class ExecutionError(ScpiError):
+    """-200..-299, e.g. -200 Execution error, -221 Settings conflict"""
+
+
+class DeviceError(ScpiError):
+    """-300..-399, device specific error"""
+
+
+class QueryError(ScpiError):
+    """-400..-499, e.g. -410 Query interrupted"""
+
+
+_ERROR_CLASSES = {1: CommandError, 2: ExecutionError, 3: DeviceError, 4: QueryError}
+
+
+def parse_error(field):
+    """return: (code, message) of a :SYSTem:ERRor? reply, e.g. '-113, "Undefined header"' -> (-113, "Undefined header")
+    A reply that is not an error reply is returned as (None, field).
+    """
+    match = ERROR_REPLY.match(field)
+    if match is None:
+        return None, field
+    return int(match.group(1)), match.group(2)
+
+
+def raise_for_error(field, command=None):
+    """Raise the ScpiError (subclass) for a :SYSTem:ERRor? reply with a non zero code"""
+    code, message = parse_error(field)
+    if code:
+        raise _ERROR_CLASSES.get(-code // 100, ScpiError)(code, message, command)
+
+
+def _number(field):
+    """return: int or float for a numeric field, None for the invalid sentinel, else the field"""
+    for convert in (int, float):
+        try:
+            value = convert(field)
+        except ValueError:
+            continue
+        return None if value == INVALID else value
+    return field
+
+
+def _float(field):
+    value = float(field)
+    return None if value == INVALID else value
+
+
+def _int(field):
+    value = _number(field)
+    return int(value) if isinstance(value, float) else value
+
+
+def _bool(field):
+    value = _number(field)
+    return value if value is None else bool(value)
+
+
+def _string(field):
+    if len(field) >= 2 and field[0] == field[-1] == '"':
+        return field[1:-1]
+    return field
+
+
+def _header_reply(field):
+    """Reply to a header query, e.g. :OUTPUT:OPTIC? -> ON/OFF"""
+    state = field.upper()
+    if state in ("ON", "OFF"):
+        return state == "ON"
+    return _number(_string(field))
+
+
+# :SENSe:DATA? result types, the first node of the result name
+RESULT_TYPES = {
+    "FLOAT": _float,
+    "RATE": _float,
+    "ERATE": _float,
+    "ESRATE": _float,
+    "RATIO": _float,
+    "INTEGER": _int,
+    "COUNT": _int,
+    "ECOUNT": _int,
+    "ACOUNT": _int,
+    "SECOND": _int,
+    "ESECOND": _int,
+    "ASECOND": _int,
+    "CSTATUS": _bool,
+    "HSTATUS": _bool,
+    "BOOL": _bool,
+    "STRING": _string,
+}
+
+
+@functools.lru_cache(maxsize=1024)
+def reply_converters(command):
+    """return: tuple with one converter per reply field of a (compound) command, None for :SYSTem:ERRor? fields"""
+    converters = []
+    for part in command.split(";"):
+        words = part.split()
+        if not words or not words[0].endswith("?"):
+            continue
+        if ERROR_QUERY.match(words[0]):
+            converters.append(None)
+        elif DATA_QUERY.match(words[0]) and len(words) > 1:
+            converters.append(RESULT_TYPES.get(words[1].split(":")[0].upper(), _number))
+        else:
+            converters.append(_header_reply)
+    return tuple(converters)
+
+
+def parse_reply(command, fields):
+    """Convert the reply fields of a command and check its :SYSTem:ERRor? fields
+    :param command: The command written, e.g. ":SENSe:DATA? SECOND:TEST:ELAPSED ;:SYSTem:ERRor?"
+    :param fields: Reply fields, one per query (see viavi.read_fields)
+    :return: list of typed values, one per query except :SYSTem:ERRor?
+    :raise ScpiError: for an error code in a :SYSTem:ERRor? reply
+    """
+    values = []
+    for convert, field in zip(reply_converters(command), fields):
+        if convert is None:
+            raise_for_error(field, command)
+        else:
+            values.append(convert(field))
+    return values
@@ -0,0 +1,572 @@
+"""
+========================================================================================================================
+# Information
+Local SCPI simulator of an MTS-5800/MPA-2100, for benchmarks and regression tests without hardware.
+
+Speaks the same newline terminated SCPI over TCP as the instrument, including the port redirection followed by
+Mpa2100.connect: base port (MOD:FUNC:PORT?) -> module port (:SYST:FUNC:PORT?) -> BERT port. Implements *REM, sessions,
+applications (launch/select/exit with configurable delays), laser, traffic, test start/stop, :SENSe:DATA? results
+and the :SENSE:EXPERT:I2C:PEEK registers of a loadable QSFP EEPROM image. Each connection selects its own
+application and has its own error queue, laser, traffic, test and I2C state belong to the port of the selected
+application (_101 or _102).
+Every command can be given a latency, jitter and drop probability (a dropped query is never answered, like a lost
+reply).
+
+    python simulator.py --base-port 8000 --latency 0.002 --jitter 0.001 --eeprom module.json
+
+    simulator = Simulator(base_port=0, delays={"SENSE:EXPERT:I2C": Delay(latency=0.001)})
+    simulator.start_background()
+    a = viavi.Mpa2100(port=simulator.base_port)
+    a.connect("127.0.0.1")
+========================================================================================================================
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+
+from ber import EXPONENT_SHIFT
+
+
+def new_connection():
+    """return: state of one client connection: selected application, session and SCPI error queue"""
+    return {"selected": None, "session": False, "errors": []}
+
+
+@dataclass
+class Delay:
+    """Response behaviour of a command: fixed latency + uniform jitter in seconds, drop probability of the reply"""
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    drop: float = 0.0
+
+
+@dataclass
+class PortState:
+    """Laser, traffic, test and I2C state of one port (applications ..._101 and ..._102)"""
+
+    laser: bool = False
+    traffic: bool = False
+    fc_traffic: bool = False
+    test_started: float = field(default_factory=time.monotonic)
+    error_seconds: int = 0
+    i2c: dict = field(default_factory=lambda: {"page": 0, "address": 0, "data": 0})
+    events: list = field(default_factory=list)  # event log lines, cleared by a test start
+
+
+def scpi_match(pattern, header):
+    """return: True if a header matches a pattern in SCPI mixed case form, each node in long or short form
+    e.g. scpi_match(":SYSTem:ERRor?", ":SYST:ERR?") -> True
+    """
+    header = header.upper()
+    pattern_nodes = pattern.lstrip(":").split(":")
+    header_nodes = header.lstrip(":").split(":")
+    if len(pattern_nodes) != len(header_nodes) or pattern.endswith("?") != header.endswith("?"):
+        return False
+    for pattern_node, node in zip(pattern_nodes, header_nodes):
+        pattern_node = pattern_node.rstrip("?")
+        node = node.rstrip("?")
+        short = "".join(character for character in pattern_node if not character.islower())
+        if node not in (pattern_node.upper(), short):
+            return False
+    return True
+
+
+# --- EEPROM image
+
+
+def _checksum(page, first, last):
+    return sum(page[first - 128 : last - 128 + 1]) & 0xFF
+
+
+def default_eeprom():
+    """return: dict with "lower" (bytearray 128) and "pages" {page: bytearray 128} of a plausible 100G QSFP28"""
+    lower = bytearray(128)
+    lower[0] = 0x11  # QSFP28
+    lower[2] = 0x04  # flat memory off, data ready
+    lower[22:24] = (int(35.5 * 256)).to_bytes(2, "big")  # temperature 35.5 C, 1/256 C
+    lower[26:28] = (33000).to_bytes(2, "big")  # Vcc 3.3 V, 100 uV
+    for lane in range(4):
+        lower[34 + 2 * lane : 36 + 2 * lane] = (8000 + 100 * lane).to_bytes(2, "big")  # rx power, 0.1 uW
+        lower[42 + 2 * lane : 44 + 2 * lane] = (3750).to_bytes(2, "big")  # tx bias 7.5 mA, 2 uA
+        lower[50 + 2 * lane : 52 + 2 * lane] = (9000).to_bytes(2, "big")  # tx power, 0.1 uW
+
+    page_00h = bytearray(128)
+    page_00h[0] = 0x11
+    page_00h[148 - 128 : 164 - 128] = b"VIAVI SIMULATOR ".ljust(16)
+    page_00h[168 - 128 : 184 - 128] = b"QSFP28-100G-SIM ".ljust(16)
+    page_00h[196 - 128 : 212 - 128] = b"SIM0000000001".ljust(16)
+    page_00h[212 - 128 : 220 - 128] = b"26101800"
+    page_00h[191 - 128] = _checksum(page_00h, 128, 190)
+    page_00h[223 - 128] = _checksum(page_00h, 192, 222)
+
+    page_20h = bytearray(128)
+    # pre-FEC BER 2.3e-5 = 230 * 10 ** (17 - 24) at 182-183 (INPHI) and 158-159 (Eopto)
+    ber = (17 << EXPONENT_SHIFT | 230).to_bytes(2, "big")
+    page_20h[182 - 128 : 184 - 128] = ber
+    page_20h[158 - 128 : 160 - 128] = ber
+
+    pages = {page: bytearray(128) for page in (1, 2, 3)}
+    pages.update({0: page_00h, 0x20: page_20h})
+    return {"lower": lower, "pages": pages}
+
+
+def load_eeprom(path):
+    """Load an EEPROM image
+    JSON: {"lower": hex, "pages": {"0": hex, "32": hex}} (page numbers in decimal)
+    binary: lower page followed by upper pages 00h, 01h, ... (128 bytes each)
+    :return: dict like default_eeprom()
+    """
+    if path.endswith(".json"):
+        with open(path) as file:
+            image = json.load(file)
+        return {
+            "lower": bytearray.fromhex(image["lower"]),
+            "pages": {int(page): bytearray.fromhex(data) for page, data in image["pages"].items()},
+        }
+    with open(path, "rb") as file:
+        data = file.read()
+    if len(data) < 128 or len(data) % 128:
+        raise ValueError(f"{path}: expected a multiple of 128 bytes, got {len(data)}")
+    return {
+        "lower": bytearray(data[:128]),
+        "pages": {page: bytearray(data[128 * (page + 1) : 128 * (page + 2)]) for page in range(len(data) // 128 - 1)},
+    }
+
+
+def save_eeprom(image, path):
+    """Write an EEPROM image as JSON (see load_eeprom)"""
+    with open(path, "w") as file:
+        json.dump(
+            {"lower": image["lower"].hex(), "pages": {str(page): data.hex() for page, data in image["pages"].items()}},
+            file,
+            indent=1,
+        )
+
+
+# --- Simulator
+
+
+class Simulator:
+    """Simulated instrument, one shared state for all ports and connections"""
+
+    module_port_query = "MODule:FUNCtion:PORT?"
+    bert_port_query = ":SYSTem:FUNCtion:PORT?"
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        base_port=8000,
+        module_port=0,
+        bert_port=0,
+        eeprom=None,
+        default=None,
+        delays=None,
+        launch_delay=0.5,
+        close_delay=0.5,
+        applications=("TermEth100GL2Traffic_101",),
+        seed=None,
+    ):
+        """
+        :param base_port: Port answering MOD:FUNC:PORT?, 0 picks a free port (see the base_port attribute after start)
+        :param module_port: Port answering :SYST:FUNC:PORT?, 0 picks a free port
+        :param bert_port: Port of the BERT application commands, 0 picks a free port
+        :param eeprom: EEPROM image (see load_eeprom), default_eeprom() if None
+        :param default: Delay of every command without an entry in delays
+        :param delays: Dict of long form command prefix -> Delay, e.g. {"SENSE:EXPERT:I2C": Delay(0.001)};
+            the longest prefix of the matched command (e.g. "SENSE:DATA? FLOAT:PHYSICAL") wins
+        :param launch_delay: Seconds from :SYST:APPL:LAUN until the application is running
+        :param close_delay: Seconds from :EXIT until the application is gone
+        :param applications: Applications running at start
+        :param seed: Random seed for jitter, drops and measurement noise (reproducible runs)
+        """
+        self.host = host
+        self.base_port = base_port
+        self.module_port = module_port
+        self.bert_port = bert_port
+        self.eeprom = eeprom if eeprom is not None else default_eeprom()
+        self.default = default if default is not None else Delay()
+        self.delays = dict(delays or {})
+        self.launch_delay = launch_delay
+        self.close_delay = close_delay
+        self.random = random.Random(seed)
+
+        # Instrument state
+        self.applications = {name: 0.0 for name in applications}  # name -> running since (monotonic)
+        self.closing = {}  # name -> gone at (monotonic)
+        self.ports = {1: PortState(), 2: PortState()}
+        # Selected application, session and error queue of the connection whose command is processed, see handle_line
+        self.connection = new_connection()
+
+        # Traffic counters, e.g. for bytes on the wire in benchmarks
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.commands = 0
+        self.dropped = 0
+
+        self.servers = []
+        self.connections = set()
+        self.loop = None
+        self.thread = None
+
+        # (pattern, handler, long form name), matched in order
+        self.handlers = [
+            ("*REM", self._ok, "*REM"),
+            (":SYSTem:ERRor?", self._error_query, "SYSTEM:ERROR?"),
+            (":SYSTem:APPLication:CAPPlications?", self._running_applications, "SYSTEM:APPLICATION:CAPP?"),
+            (":SYSTem:APPLication:LAUNch?", self._running_applications, "SYSTEM:APPLICATION:LAUNCH?"),
+            (":SYSTem:APPLication:LAUNch", self._launch, "SYSTEM:APPLICATION:LAUNCH"),
+            (":SYSTem:APPLication:SELect", self._select, "SYSTEM:APPLICATION:SELECT"),
+            (":SYSTem:REBoot", self._ok, "SYSTEM:REBOOT"),
+            (":SESSion:CREate", self._session_start, "SESSION:CREATE"),
+            (":SESSion:STARt", self._session_start, "SESSION:START"),
+            (":SESSion:END", self._session_end, "SESSION:END"),
+            (":EXIT", self._exit, "EXIT"),
+            (":OUTPut:OPTic?", lambda args: "ON" if self.port.laser else "OFF", "OUTPUT:OPTIC?"),
+            (":OUTPut:OPTic", self._laser, "OUTPUT:OPTIC"),
+            (":SOURce:MAC:TRAFfic?", lambda args: "ON" if self.port.traffic else "OFF", "SOURCE:MAC:TRAFFIC?"),
+            (":SOURce:MAC:TRAFfic", self._traffic, "SOURCE:MAC:TRAFFIC"),
+            (
+                ":SOURce:FCHannel:TRAFfic?",
+                lambda args: "ON" if self.port.fc_traffic else "OFF",
+                "SOURCE:FCHANNEL:TRAFFIC?",
+            ),
+            (":SOURce:FCHannel:TRAFfic", self._fc_traffic, "SOURCE:FCHANNEL:TRAFFIC"),
+            (":SOURce:PCS:PHY:INSERT:CODE", self._insert_code_error, "SOURCE:PCS:PHY:INSERT:CODE"),
+            (":INPut:SFP1:OVERload:OPTic:RESet", self._ok, "INPUT:SFP1:OVERLOAD:OPTIC:RESET"),
+            (":ABORt", self._test_stop, "ABORT"),
+            (":INITiate", self._test_start, "INITIATE"),
+            (":SENSe:EXPert:I2C:PEEK:PAGESEL", self._i2c_page, "SENSE:EXPERT:I2C:PEEK:PAGESEL"),
+            (":SENSe:EXPert:I2C:PEEK:REGADDR", self._i2c_address, "SENSE:EXPERT:I2C:PEEK:REGADDR"),
+            (":SENSe:EXPert:I2C:PEEK:TRIGger", self._i2c_trigger, "SENSE:EXPERT:I2C:PEEK:TRIGGER"),
+            (":SENSe:DATA?", self._data, "SENSE:DATA?"),
+        ]
+
+    # --- Servers
+
+    async def start(self):
+        """Open the three listening ports, the actual port numbers are stored in base_port/module_port/bert_port"""
+        bert = await asyncio.start_server(lambda r, w: self._serve(r, w, "bert"), self.host, self.bert_port)
+        self.bert_port = bert.sockets[0].getsockname()[1]
+        module = await asyncio.start_server(lambda r, w: self._serve(r, w, "module"), self.host, self.module_port)
+        self.module_port = module.sockets[0].getsockname()[1]
+        base = await asyncio.start_server(lambda r, w: self._serve(r, w, "base"), self.host, self.base_port)
+        self.base_port = base.sockets[0].getsockname()[1]
+        self.servers = [base, module, bert]
+
+    async def close(self):
+        """Close the listening ports and all client connections"""
+        for server in self.servers:
+            server.close()
+        for task in list(self.connections):
+            task.cancel()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        for server in self.servers:
+            await server.wait_closed()
+        self.servers = []
+
+    async def serve_forever(self):
+        await self.start()
+        await asyncio.gather(*(server.serve_forever() for server in self.servers))
+
+    def start_background(self):
+        """Run the simulator in a daemon thread with its own event loop, return when the ports are open"""
+        ready = threading.Event()
+        self.loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self.start())
+            ready.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, name="viavi-simulator", daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self
+
+    def stop_background(self):
+        asyncio.run_coroutine_threadsafe(self.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def _serve(self, reader, writer, role):
+        task = asyncio.current_task()
+        self.connections.add(task)
+        connection = new_connection()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.bytes_received += len(line)
+                reply = await self.handle_line(line.decode("ascii", "replace"), role, connection)
+                if reply:
+                    writer.write(reply.encode("ascii"))
+                    self.bytes_sent += len(reply)
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self.connections.discard(task)
+            writer.close()
+
+    # --- Command processing
+
+    def _delay(self, name):
+        """return: Delay of the longest configured prefix of a long form command name"""
+        best = None
+        for prefix, delay in self.delays.items():
+            if name.startswith(prefix) and (best is None or len(prefix) > len(best)):
+                best = prefix
+        return self.delays[best] if best is not None else self.default
+
+    async def handle_line(self, line, role="bert", connection=None):
+        """Process one line (possibly a compound command), return: the reply text (one line per answered query)
+        :param connection: new_connection() dict of the client, None: the last one used
+        """
+        self._update_applications()
+        reply = []
+        for part in line.split(";"):
+            words = part.split(None, 1)
+            if not words:
+                continue
+            header, args = words[0], words[1].strip() if len(words) > 1 else ""
+            self.commands += 1
+
+            if role == "base" and scpi_match(self.module_port_query, header):
+                handler, name = lambda args: str(self.module_port), "MODULE:FUNCTION:PORT?"
+            elif role == "module" and scpi_match(self.bert_port_query, header):
+                handler, name = lambda args: str(self.bert_port), "SYSTEM:FUNCTION:PORT?"
+            else:
+                handler, name = self._find(header)
+            if name == "SENSE:DATA?":
+                name = f"SENSE:DATA? {args.upper()}"
+
+            delay = self._delay(name)
+            if delay.latency or delay.jitter:
+                await asyncio.sleep(delay.latency + self.random.uniform(0, delay.jitter))
+            if delay.drop and self.random.random() < delay.drop:
+                self.dropped += 1
+                continue
+
+            # Handlers run without awaiting, the connection can not change while one runs
+            if connection is not None:
+                self.connection = connection
+            if handler is None:
+                # Like the instrument: no reply, the error is queued for :SYSTem:ERRor?
+                self.errors.append('-113, "Undefined header"')
+                continue
+            result = handler(args)
+            if header.endswith("?"):
+                reply.append(f"{result}\n")
+        return "".join(reply)
+
+    def _find(self, header):
+        for pattern, handler, name in self.handlers:
+            if scpi_match(pattern, header):
+                return handler, name
+        return None, header.upper().lstrip(":")
+
+    def _update_applications(self):
+        now = time.monotonic()
+        for name, gone_at in list(self.closing.items()):
+            if now >= gone_at:
+                self.applications.pop(name, None)
+                del self.closing[name]
+
+    @property
+    def errors(self):
+        """Error queue of the current connection, read by :SYSTem:ERRor?"""
+        return self.connection["errors"]
+
+    @property
+    def selected(self):
+        """Application selected by the current connection, None if none or closed since"""
+        selected = self.connection["selected"]
+        return selected if selected in self.applications else None
+
+    @property
+    def port_no(self):
+        """Port of the selected application (1 or 2), port 1 if none is selected"""
+        selected = self.selected
+        return int(selected[-1]) if selected and selected[-1] in "12" else 1
+
+    @property
+    def port(self):
+        """PortState of the selected application"""
+        return self.ports[self.port_no]
+
+    def _event(self, text):
+        """Add an event log line, e.g. 2026-10-18 12:00:00, Port 1, Laser On"""
+        self.port.events.append(f"{time.strftime('%Y-%m-%d %H:%M:%S')}, Port {self.port_no}, {text}")
+
+    def _running(self):
+        now = time.monotonic()
+        return [name for name, since in self.applications.items() if since <= now]
+
+    # --- Handlers, return the reply of a query (ignored for commands)
+
+    def _ok(self, args):
+        return None
+
+    def _error_query(self, args):
+        return self.errors.pop(0) if self.errors else '0, "No error"'
+
+    def _running_applications(self, args):
+        return '"' + ",".join(self._running()) + '"'
+
+    def _launch(self, args):
+        # e.g. "TermEth40GL2Traffic 1" -> TermEth40GL2Traffic_101
+        match = re.match(r"(\w+)\s+(\d)$", args)
+        if match is None:
+            self.errors.append('-200, "Execution error"')
+            return None
+        self.applications[f"{match.group(1)}_10{match.group(2)}"] = time.monotonic() + self.launch_delay
+
+    def _select(self, args):
+        if args not in self._running():
+            self.errors.append('-200, "Execution error"')
+            return None
+        self.connection["selected"] = args
+
+    def _session_start(self, args):
+        self.connection["session"] = True
+
+    def _session_end(self, args):
+        self.connection["session"] = False
+
+    def _exit(self, args):
+        if self.selected is None:
+            self.errors.append('-200, "Execution error"')
+            return None
+        self.closing[self.selected] = time.monotonic() + self.close_delay
+
+    def _toggle(self, state, args):
+        if args.upper() in ("ON", "1"):
+            return True
+        if args.upper() in ("OFF", "0"):
+            return False
+        return not state
+
+    def _laser(self, args):
+        self.port.laser = self._toggle(self.port.laser, args)
+        self._event("Laser On" if self.port.laser else "Laser Off")
+
+    def _traffic(self, args):
+        self.port.traffic = self._toggle(self.port.traffic, args)
+
+    def _fc_traffic(self, args):
+        self.port.fc_traffic = self._toggle(self.port.fc_traffic, args)
+
+    def _insert_code_error(self, args):
+        self.port.error_seconds += 1
+        self._event("Code Error Inserted")
+
+    def _test_stop(self, args):
+        self.port.test_started = None
+        self._event("Test Stopped")
+
+    def _test_start(self, args):
+        self.port.test_started = time.monotonic()
+        self.port.error_seconds = 0
+        self.port.events.clear()
+
+    def _i2c_page(self, args):
+        self.port.i2c["page"] = int(args)
+
+    def _i2c_address(self, args):
+        self.port.i2c["address"] = int(args)
+
+    def _i2c_trigger(self, args):
+        i2c = self.port.i2c
+        page, address = i2c["page"], i2c["address"]
+        if address < 128:
+            i2c["data"] = self.eeprom["lower"][address]
+        elif page in self.eeprom["pages"]:
+            i2c["data"] = self.eeprom["pages"][page][address - 128]
+        else:
+            i2c["data"] = 0
+
+    def _data(self, args):
+        """:SENSe:DATA? results, 9.91e+37 (invalid) for results that are not simulated"""
+        result = args.upper()
+        port = self.port
+        link = port.laser and self.selected is not None
+        if result == ":SENSE:EXPERT:I2C:PEEK:REGDATA":
+            return str(port.i2c["data"])
+        if result == "FLOAT:PHYSICAL:QSFP:RX:POWER:LEVEL:SUM":
+            return f"{3.8 + self.random.gauss(0, 0.02):.5f}" if port.laser else "-40.00000"
+        if result == "FLOAT:PHYSICAL:QSFP:TX:POWER:LEVEL:SUM":
+            return "3.95000" if port.laser else "-40.00000"
+        if result == "INTEGER:PHYSICAL:TX:LEVEL:DBM":
+            return "-2" if port.laser else "-40"
+        if result == "SECOND:TEST:ELAPSED":
+            return str(int(time.monotonic() - port.test_started)) if port.test_started is not None else "0"
+        if result == "ESECOND:PERFORMANCE:ETHERNET:G826:NE:OOS":
+            return str(port.error_seconds)
+        if result == "CSTATUS:PCS:PHY:LINK:ACTIVE":
+            return "1" if link else "0"
+        if result in ("CSTATUS:PHYSICAL:OVRLD", "CSTATUS:PHYSICAL:SFP1:PRESENT"):
+            return "0"
+        if result == "STRING:TEST:EVENT:LOG":
+            return '"' + "".join(line + "\n" for line in port.events) + '"'
+        return "9.91e+37"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated VIAVI MTS-5800/MPA-2100 SCPI instrument")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=8000)
+    parser.add_argument("--module-port", type=int, default=8002)
+    parser.add_argument("--bert-port", type=int, default=8006)
+    parser.add_argument("--eeprom", help="EEPROM image, JSON or binary (see load_eeprom)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per command")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random seconds per command")
+    parser.add_argument("--drop", type=float, default=0.0, help="probability a command is lost")
+    parser.add_argument(
+        "--delay",
+        action="append",
+        default=[],
+        metavar="PREFIX=LATENCY[,JITTER[,DROP]]",
+        help='per command delay, e.g. "SENSE:EXPERT:I2C=0.002,0.001"',
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    delays = {}
+    for entry in args.delay:
+        prefix, values = entry.split("=", 1)
+        delays[prefix.upper().lstrip(":")] = Delay(*(float(value) for value in values.split(",")))
+    simulator = Simulator(
+        host=args.host,
+        base_port=args.base_port,
+        module_port=args.module_port,
+        bert_port=args.bert_port,
+        eeprom=load_eeprom(args.eeprom) if args.eeprom else None,
+        default=Delay(args.latency, args.jitter, args.drop),
+        delays=delays,
+        seed=args.seed,
+    )
+
+    async def run():
+        await simulator.start()
+        print(f"Simulator on {args.host}: base {simulator.base_port}, module {simulator.module_port}, "
+              f"BERT {simulator.bert_port}")
+        await asyncio.gather(*(server.serve_forever() for server in simulator.servers))
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
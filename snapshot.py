@@ -0,0 +1,185 @@
+"""
+========================================================================================================================
+# Information
+Snapshot of the whole QSFP memory map (SFF-8636) in a single image: the lower page (registers 0-127) followed by the
+upper pages (registers 128-255) in the order of ``pages``. A refresh reads only the volatile regions (status,
+interrupt flags, monitors and the vendor BER registers) and returns the changes, so monitoring a module costs a few
+dozen registers per cycle instead of the whole map.
+
+    snap = Snapshot.capture(a, cache=EepromCache("eeprom_cache.json"))
+    while True:
+        for page, address, old, new in snap.refresh(a):
+            print(f"page {page:02X}h {address}: {old.hex()} -> {new.hex()}")
+========================================================================================================================
+"""
+
+import json
+import time
+
+from viavi import format_page
+
+# Upper pages of a snapshot: 00h-03h (SFF-8636) and the vendor pages 20h/21h (pre-FEC BER)
+DEFAULT_PAGES = (0, 1, 2, 3, 32, 33)
+
+# page -> ((first address, length), ...) re-read by refresh. Page 0 registers below 128 are the lower page.
+VOLATILE = {
+    0: (
+        (2, 1),  # status, data not ready
+        (3, 12),  # interrupt flags: LOS, fault, LOL, temperature, Vcc, rx power, tx bias, tx power
+        (22, 6),  # module monitors: temperature, reserved, Vcc
+        (34, 24),  # channel monitors: rx power, tx bias, tx power of 4 lanes
+    ),
+    32: (
+        (158, 2),  # pre-FEC BER (Eopto)
+        (182, 2),  # pre-FEC BER (INPHI)
+    ),
+}
+
+
+def merge_regions(regions, gap=0):
+    """return: sorted (first address, length) regions with overlapping regions, or regions at most ``gap`` registers
+    apart, merged into one (every region read costs a page select and an error check round trip)
+    """
+    merged = []
+    for first, length in sorted(regions):
+        if merged and first <= merged[-1][0] + merged[-1][1] + gap:
+            last = max(merged[-1][0] + merged[-1][1], first + length)
+            merged[-1] = (merged[-1][0], last - merged[-1][0])
+        else:
+            merged.append((first, length))
+    return merged
+
+
+class Snapshot:
+    """Image of the lower page and the upper pages of one module"""
+
+    def __init__(self, pages=DEFAULT_PAGES, image=None, volatile=None, timestamp=None):
+        """
+        :param pages: Upper page numbers in the image
+        :param image: Lower page + upper pages, 128 registers each, zeros if None
+        :param volatile: page -> (first address, length) regions re-read by refresh, default: VOLATILE
+        """
+        self.pages = tuple(pages)
+        size = 128 * (1 + len(self.pages))
+        self.image = bytearray(image if image is not None else size)
+        if len(self.image) != size:
+            raise ValueError(f"Expected {size} bytes for {len(self.pages)} upper pages, got {len(self.image)}")
+        self.volatile = VOLATILE if volatile is None else volatile
+        self.timestamp = timestamp
+        # Registers read from the instrument by capture and refresh
+        self.registers_read = 0
+
+    def _offset(self, page, address):
+        """return: image offset of a register, page is ignored for the lower page (address < 128)"""
+        if address < 128:
+            return address
+        try:
+            index = self.pages.index(page)
+        except ValueError:
+            raise KeyError(f"Page {page:02X}h is not in the snapshot") from None
+        return 128 * (1 + index) + address - 128
+
+    def _location(self, offset):
+        """return: (page, address) of an image offset, inverse of _offset"""
+        if offset < 128:
+            return 0, offset
+        return self.pages[offset // 128 - 1], 128 + offset % 128
+
+    def read(self, page, address, length=1):
+        """return: registers address..address + length - 1 of a page as bytes (not crossing the 127/128 boundary)"""
+        offset = self._offset(page, address)
+        return bytes(self.image[offset : offset + length])
+
+    @property
+    def lower(self):
+        """Lower page, registers 0-127"""
+        return bytes(self.image[:128])
+
+    def page(self, page):
+        """return: upper page (registers 128-255) as bytes"""
+        return self.read(page, 128, 128)
+
+    @classmethod
+    def capture(cls, instrument, pages=DEFAULT_PAGES, cache=None, volatile=None):
+        """Read the lower page and all upper pages
+        :param instrument: Connected Mpa2100 (or anything with read_i2c_block)
+        :param cache: eeprom_cache.EepromCache, static upper pages are then read from the cache when valid
+        """
+        snapshot = cls(pages, volatile=volatile)
+        snapshot.image[:128] = instrument.read_i2c_block(0, 0, 128)
+        snapshot.registers_read += 128
+        for index, page in enumerate(snapshot.pages):
+            if cache is not None:
+                page_reads = cache.page_reads
+                data = cache.read_page(instrument, page)
+                snapshot.registers_read += 128 * (cache.page_reads - page_reads)
+            else:
+                data = instrument.read_i2c_block(page, 128, 128)
+                snapshot.registers_read += 128
+            snapshot.image[128 * (1 + index) : 128 * (2 + index)] = data
+        snapshot.timestamp = time.time()
+        return snapshot
+
+    def refresh(self, instrument, gap=0):
+        """Re-read the volatile regions of the pages in the snapshot, update the image
+        :param gap: Merge regions at most ``gap`` registers apart into one read
+        :return: changes, see diff
+        """
+        previous = bytes(self.image)
+        for page, regions in self.volatile.items():
+            for first, length in merge_regions(regions, gap):
+                if first >= 128 and page not in self.pages:
+                    continue
+                offset = self._offset(page, first)
+                self.image[offset : offset + length] = instrument.read_i2c_block(page, first, length)
+                self.registers_read += length
+        self.timestamp = time.time()
+        return self._changes(previous, self.image)
+
+    def diff(self, other):
+        """return: changes from ``other`` (an earlier snapshot of the same pages) to this snapshot, see _changes"""
+        if other.pages != self.pages:
+            raise ValueError("Snapshots of different pages can not be compared")
+        return self._changes(other.image, self.image)
+
+    def _changes(self, old, new):
+        """return: list of (page, first address, old bytes, new bytes), one per run of consecutive changed registers
+        within a page
+        """
+        changes = []
+
+        def add(start, end):
+            page, address = self._location(start)
+            changes.append((page, address, bytes(old[start:end]), bytes(new[start:end])))
+
+        start = None
+        for offset in range(len(new)):
+            if old[offset] == new[offset]:
+                if start is not None:
+                    add(start, offset)
+                    start = None
+                continue
+            # A run does not continue into the next page
+            if start is not None and offset % 128 == 0:
+                add(start, offset)
+                start = None
+            if start is None:
+                start = offset
+        if start is not None:
+            add(start, len(new))
+        return changes
+
+    def to_json(self):
+        return json.dumps({"pages": self.pages, "timestamp": self.timestamp, "image": self.image.hex()})
+
+    @classmethod
+    def from_json(cls, text, volatile=None):
+        data = json.loads(text)
+        return cls(data["pages"], bytes.fromhex(data["image"]), volatile, data["timestamp"])
+
+    def format(self):
+        """return: hex dump of the lower page and every upper page"""
+        lines = ["Base page: ", format_page(self.lower)]
+        for page in self.pages:
+            lines += [f"Page {page}:", format_page(self.page(page), 128)]
+        return "\n".join(lines)
@@ -0,0 +1,237 @@
+"""
+========================================================================================================================
+# Information
+Record the SCPI traffic of an Mpa2100 session to a transcript file and replay it without the instrument. Both are
+transports of Mpa2100 (transport=...): RecordingTransport wraps telnetlib.Telnet and logs every connection, write and
+read with its time; Replay serves the recorded reads back, at the recorded timing (speed=1.0, 2.0 twice as fast) or
+as fast as possible (speed=None), and checks that the client writes the recorded commands.
+
+File layout (little endian):
+    header  b"VIAVISCP", u32 version, u32 meta length, JSON meta
+    record  u8 kind, u16 connection, f8 seconds since the start, u32 length, data
+
+    recording = RecordingTransport("session.scpi")
+    a = viavi.Mpa2100(transport=recording)
+    a.connect("10.10.40.197")
+    ...
+    recording.close()
+
+    replay = Replay("session.scpi", speed=None)
+    a = viavi.Mpa2100(transport=replay, port_cache=replay.port_cache())
+    a.connect("10.10.40.197")
+    ...  # the same calls as recorded
+========================================================================================================================
+"""
+
+import argparse
+import collections
+import json
+import struct
+import telnetlib
+import threading
+import time
+
+from viavi import PortCache
+
+MAGIC = b"VIAVISCP"
+VERSION = 1
+FILE_HEADER = struct.Struct("<8sII")
+RECORD_HEADER = struct.Struct("<BHdI")
+
+# Record kinds
+OPEN = 0  # data: "host:port"
+OPEN_FAILED = 1  # data: "host:port error"
+WRITE = 2
+READ = 3
+CLOSE = 4
+KIND_NAMES = {OPEN: "open", OPEN_FAILED: "open failed", WRITE: "write", READ: "read", CLOSE: "close"}
+
+
+class ReplayError(ValueError):
+    """The client does not follow the transcript, e.g. writes another command than recorded"""
+
+
+def read_transcript(path):
+    """return: (meta dict, list of (kind, connection, seconds, data)); a record cut short at the end is ignored"""
+    with open(path, "rb") as file:
+        buffer = file.read()
+    magic, version, meta_length = FILE_HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a transcript")
+    offset = FILE_HEADER.size
+    meta = json.loads(buffer[offset : offset + meta_length])
+    offset += meta_length
+
+    records = []
+    while offset + RECORD_HEADER.size <= len(buffer):
+        kind, connection, seconds, length = RECORD_HEADER.unpack_from(buffer, offset)
+        offset += RECORD_HEADER.size
+        if offset + length > len(buffer):
+            break
+        records.append((kind, connection, seconds, bytes(buffer[offset : offset + length])))
+        offset += length
+    return meta, records
+
+
+class RecordingTransport:
+    """Mpa2100 transport: telnetlib.Telnet connections whose traffic is appended to a transcript file"""
+
+    def __init__(self, path, transport=telnetlib.Telnet, meta=None):
+        """
+        :param path: Transcript file, overwritten
+        :param transport: Transport of the real connections
+        :param meta: Extra JSON serialisable information for the header
+        """
+        self.transport = transport
+        self.file = open(path, "wb")
+        meta = dict(meta or {}, time=time.time())
+        meta = json.dumps(meta).encode("utf-8")
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION, len(meta)) + meta)
+        self.start = time.perf_counter()
+        self.connections = 0
+        # Connections of several threads (e.g. dual_port.DualPort) share the file
+        self.lock = threading.Lock()
+
+    def record(self, kind, connection, data):
+        with self.lock:
+            seconds = time.perf_counter() - self.start
+            self.file.write(RECORD_HEADER.pack(kind, connection, seconds, len(data)) + data)
+
+    def __call__(self, host, port, timeout=None):
+        with self.lock:
+            connection = self.connections
+            self.connections += 1
+        try:
+            tn = self.transport(host, port, timeout)
+        except OSError as error:
+            self.record(OPEN_FAILED, connection, f"{host}:{port} {error}".encode("utf-8"))
+            raise
+        self.record(OPEN, connection, f"{host}:{port}".encode("utf-8"))
+        return RecordingConnection(tn, self, connection)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class RecordingConnection:
+    """Telnet connection logging its writes and reads"""
+
+    def __init__(self, tn, recording, connection):
+        self.tn = tn
+        self.recording = recording
+        self.connection = connection
+
+    def write(self, data):
+        self.recording.record(WRITE, self.connection, data)
+        self.tn.write(data)
+
+    def read_until(self, expected, timeout=None):
+        data = self.tn.read_until(expected, timeout)
+        self.recording.record(READ, self.connection, data)
+        return data
+
+    def close(self):
+        self.recording.record(CLOSE, self.connection, b"")
+        self.tn.close()
+
+
+class Replay:
+    """Mpa2100 transport serving a transcript, the connections are handed out in the recorded order"""
+
+    def __init__(self, path, speed=None, check_writes=True):
+        """
+        :param speed: None replays as fast as possible, else recorded timing divided by speed (1.0 = real time)
+        :param check_writes: Raise ReplayError when the client writes other data than recorded
+        """
+        self.meta, records = read_transcript(path)
+        self.speed = speed
+        self.check_writes = check_writes
+        self.opens = collections.deque()  # (kind, connection, seconds, data) of OPEN and OPEN_FAILED
+        self.events = collections.defaultdict(collections.deque)  # connection -> records after its open
+        for record in records:
+            kind, connection = record[0], record[1]
+            if kind in (OPEN, OPEN_FAILED):
+                self.opens.append(record)
+            else:
+                self.events[connection].append(record)
+        self.start = None
+
+    def port_cache(self, base_port=8000):
+        """return: PortCache for the replayed client, holding the BERT port if the recorded session used a cached one
+        (then its first connection is not to the base port)
+        """
+        cache = PortCache()
+        if self.opens:
+            host, port = self.opens[0][3].decode("utf-8").split()[0].rsplit(":", 1)
+            if int(port) != base_port:
+                cache.put(host, base_port, port)
+        return cache
+
+    def _wait(self, seconds):
+        """Sleep until the recorded time of a record (no wait without speed)"""
+        if self.speed is None:
+            return
+        if self.start is None:
+            self.start = time.perf_counter() - seconds / self.speed
+        delay = self.start + seconds / self.speed - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def __call__(self, host, port, timeout=None):
+        if not self.opens:
+            raise ReplayError(f"Transcript has no more connections, client opens {host}:{port}")
+        kind, connection, seconds, data = self.opens.popleft()
+        address, _, error = data.decode("utf-8").partition(" ")
+        if address.rsplit(":", 1)[1] != str(port):
+            raise ReplayError(f"Recorded connection to {address}, client opens {host}:{port}")
+        self._wait(seconds)
+        if kind == OPEN_FAILED:
+            raise ConnectionRefusedError(error)
+        return ReplayConnection(self, self.events[connection])
+
+    def remaining(self):
+        """return: number of recorded records not replayed yet"""
+        return len(self.opens) + sum(len(events) for events in self.events.values())
+
+
+class ReplayConnection:
+    """Connection serving the recorded reads of one connection"""
+
+    def __init__(self, replay, events):
+        self.replay = replay
+        self.events = events
+
+    def _next(self, kind, action):
+        if not self.events or self.events[0][0] != kind:
+            recorded = KIND_NAMES[self.events[0][0]] if self.events else "end of connection"
+            raise ReplayError(f"Client {action}, recorded: {recorded}")
+        kind, connection, seconds, data = self.events.popleft()
+        self.replay._wait(seconds)
+        return data
+
+    def write(self, data):
+        recorded = self._next(WRITE, f"writes {data!r}")
+        if self.replay.check_writes and recorded != data:
+            raise ReplayError(f"Client writes {data!r}, recorded {recorded!r}")
+
+    def read_until(self, expected, timeout=None):
+        return self._next(READ, "reads")
+
+    def close(self):
+        if self.events and self.events[0][0] == CLOSE:
+            self.events.popleft()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print an SCPI session transcript")
+    parser.add_argument("transcript")
+    args = parser.parse_args()
+    meta, records = read_transcript(args.transcript)
+    print(f"meta: {meta}")
+    for kind, connection, seconds, data in records:
+        print(f"{seconds:12.6f} {connection:3} {KIND_NAMES.get(kind, kind):12} {data.decode('ascii', 'replace')!r}")
+
+
+if __name__ == "__main__":
+    main()
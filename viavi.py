@@ -2,20 +2,137 @@
 ========================================================================================================================
 # Information
 # SCPI for VIAVI does not have an prompt (e.g. tn.read_until(b"prompt") is not possible).
-Set an value "****$$$$" that will not be matched, interrupted at timeout instead.
+Every query (header ending with "?") is answered with one newline terminated field, the reply is framed by
+counting fields (read_fields). The timeout is only an upper bound for a missing reply; the part of a reply that
+arrives late is drained (drain) so it is not read as the reply of the next query.
 ========================================================================================================================
 """
 
 # TODO clean up: <FUNCTION (traffic)> <ADDITIONAL INFO> < STATE(start/stop/toggle)>  --> (traffic_FC_start, laser_on)
 
-import inspect
+import json
+import logging
+import os
 import re
 import telnetlib
 import time
 
+import ddm
+from ber import decode_pre_fec_ber
+from catalog import command_mnemonics, get_catalog
+from metrics import default_metrics
+from scpi import ExecutionError, ScpiError, parse_reply
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownCommandError(ValueError):
+    """Command is not in the command set of the selected application (VIAVI/Mts Applications)"""
+
+
+def count_queries(command):
+    """return the number of reply fields for a (compound) command, one per query header"""
+    return sum(part.split()[0].endswith("?") for part in command.split(";") if part.strip())
+
+
+def read_fields(tn, count, timeout=5):
+    """Read newline terminated reply fields, return as soon as ``count`` fields has arrived
+    :param tn: Telnet connection
+    :param count: Number of (non empty) fields to wait for
+    :param timeout: Upper bound in seconds for all fields
+    :return: list of str
+    """
+    fields = []
+    parts = []  # of the field in progress, joined once complete
+    quotes = 0
+    deadline = time.monotonic() + timeout
+    while len(fields) < count:
+        # A quoted string (e.g. the event log) can span several lines: inside one, read up to the closing quote at once
+        expected = b'"' if quotes % 2 else b"\n"
+        part = tn.read_until(expected, timeout=max(deadline - time.monotonic(), 0)).decode("ascii")
+        if not part.endswith(expected.decode("ascii")):
+            received = fields + ["".join(parts) + part]
+            drain(tn)
+            raise TimeoutError(f"Expected {count} reply fields within {timeout}s, got {received}")
+        parts.append(part)
+        quotes += part.count('"')
+        if quotes % 2 or not part.endswith("\n"):
+            continue
+        field = "".join(parts).strip()
+        parts = []
+        quotes = 0
+        if field:
+            fields.append(field)
+    return fields
+
+
+def drain(tn, settle=0.1):
+    """Discard pending input, until nothing arrived for ``settle`` seconds
+    :param tn: Telnet connection
+    :return: bytes discarded
+    """
+    discarded = b""
+    while True:
+        try:
+            data = tn.read_until(b"\n", timeout=settle)
+        except EOFError:
+            return discarded
+        if not data:
+            return discarded
+        discarded += data
+
+
+def format_page(data, first_address=0):
+    """return a hex dump of I2C registers, 16 per row, e.g. "80: 0d 00 ..." """
+    lines = ["    00 01 02 03 04 05 06 07 08 09 0A 0B 0C 0D 0E 0F"]
+    for offset in range(0, len(data), 16):
+        row = data[offset : offset + 16]
+        lines.append(f"{first_address + offset:02X}: " + " ".join(f"{byte:02x}" for byte in row) + " ")
+    return "\n".join(lines)
+
+
+class PortCache:
+    """Resolved BERT port per (host, base port), kept in-process with a TTL and optionally in a JSON file"""
+
+    def __init__(self, path=None, ttl=24 * 3600):
+        """
+        :param path: JSON file to persist the ports between script runs, None keeps them in-process only
+        :param ttl: Seconds before a cached port is discovered again
+        """
+        self.path = path
+        self.ttl = ttl
+        self.ports = {}  # "host:base_port" -> {"port": "800x", "time": epoch}
+        if path and os.path.exists(path):
+            with open(path) as file:
+                self.ports = json.load(file)
+
+    def get(self, host, base_port):
+        """return: the cached port or None if unknown or expired"""
+        entry = self.ports.get(f"{host}:{base_port}")
+        if entry is None or time.time() - entry["time"] > self.ttl:
+            return None
+        return entry["port"]
+
+    def put(self, host, base_port, port):
+        self.ports[f"{host}:{base_port}"] = {"port": str(port), "time": time.time()}
+        self._save()
+
+    def invalidate(self, host, base_port):
+        if self.ports.pop(f"{host}:{base_port}", None) is not None:
+            self._save()
+
+    def _save(self):
+        if self.path:
+            with open(self.path, "w") as file:
+                json.dump(self.ports, file, indent=1)
 
-class Mpa2100:
-    """Class for Instrument Mpa2100 (viavi)"""
+
+# Shared by all instruments in the process, see Mpa2100.connect
+default_port_cache = PortCache()
+
+
+class Mpa2100Commands:
+    """SCPI commands for Instrument Mpa2100 (viavi), shared by Mpa2100 and AsyncMpa2100"""
 
     # SCPI Commands
     SCPI_multiple_cmd_separator = " ;"
@@ -70,119 +187,219 @@ class Mpa2100:
     SCPI_cmd_insert_single_code_error = (
         ":SOURCE:PCS:PHY:INSERT:CODE"
     )  # Insert single code 'Error' (at Eth)
+    SCPI_cmd_i2c_peek_pagesel = ":SENSE:EXPERT:I2C:PEEK:PAGESEL"
+    SCPI_cmd_i2c_peek_regaddr = ":SENSE:EXPERT:I2C:PEEK:REGADDR"
+    SCPI_cmd_i2c_peek_trigger = ":SENSE:EXPERT:I2C:PEEK:Trigger"
+    SCPI_cmd_i2c_peek_regdata = ":SENSe:DATA? :SENSE:EXPERT:I2C:PEEK:REGDATA"
 
-    # Interrupt reading when the following sub-strings are matched
-    read_until_error_free = b"No error"
-    read_until_timeout = b"***$$$---@@@+++"
+    # Number of I2C PEEK sequences written ahead of their replies (read_i2c_block)
+    i2c_pipeline_depth = 16
 
-    def __init__(self, port=8000, timeout=30):
-        self.eqpt_ber_ip = '10.10.40.197'
-        self.port = port
-        self.timeout = timeout
+    # Application launch/close waits: :SYST:APPL:CAPP? poll interval, doubled per poll up to the max, and timeout
+    app_poll_min = 0.25
+    app_poll_max = 5.0
+    app_wait_timeout = 120
 
     @staticmethod
-    def __error_codes():
-        """return a list of known error codes for SCPI"""
-        error_codes = [
-            "-100",
-            "-102",
-            "-103",
-            "-108",
-            "-109",
-            "-113",
-            "-120",
-            "-121",
-            "-138",
-            "-141",
-            "-144",
-            "-150",
-            "-151",
-            "-200",
-            "-220",
-            "-221",
-            "-222",
-            "-224",
-            "-231",
-        ]
-        return error_codes
+    def _running_name(application):
+        """return: name in the :SYST:APPL:CAPP? reply, e.g. "TermEth40GL2Traffic 1" (launch form) -> "..._101" """
+        name, _, port = application.partition(" ")
+        return f"{name}_10{port.strip()}" if port.strip() else name
+
+    @classmethod
+    def _is_running(cls, reply, application):
+        """return: True if the :SYST:APPL:CAPP? reply lists the application ("TermEth40GL2Traffic" matches any port)"""
+        name = cls._running_name(application)
+        return any(
+            running == name or running.startswith(name + "_10") for running in re.findall(r"\w+_10\d", reply)
+        )
+
+    # Commands of this class missing in the catalog of the Eth applications (VIAVI/Mts Applications is older than the
+    # firmware), never validated: sent as they are, the instrument reports an unsupported one with -113
+    uncataloged_cmds = frozenset(
+        mnemonic
+        for command in (
+            SCPI_cmd_i2c_peek_pagesel,
+            SCPI_cmd_event_log_100G_appl,
+            SCPI_cmd_overload,
+            SCPI_cmd_reset_overload_sfp1,
+            SCPI_cmd_reset_overload_sfp2,
+            SCPI_cmd_sfp1_present,
+            SCPI_cmd_read_tx_SFP,
+            SCPI_cmd_toggle_traffic_fchannel,
+            SCPI_cmd_read_traffic_fchannel_button_status,
+        )
+        for part, mnemonic in command_mnemonics(command)
+    )
+
+    def _validate(self, command):
+        """Check a (compound) command against the catalog command set of the selected application, before sending
+        Nothing is checked if validation is off, no application is selected, the catalog index is not built
+        (python catalog.py build) or the application is not in the catalog.
+        :raise UnknownCommandError: if a part of the command is not a command of the application
+        """
+        application = self.application
+        if not self.validate or application is None:
+            return
+        for part, mnemonic in command_mnemonics(command):
+            if (application, mnemonic) in self._valid_cmds or mnemonic in self.uncataloged_cmds:
+                continue
+            catalog = get_catalog()
+            if catalog is None:
+                return
+            if catalog.has_application(application) and not catalog.supports(application, mnemonic):
+                raise UnknownCommandError(f"'{part}' is not a command of {application}")
+            self._valid_cmds.add((application, mnemonic))
+
+
+class Mpa2100(Mpa2100Commands):
+    """Class for Instrument Mpa2100 (viavi)"""
 
-    def __test_status(self, status, function_name, cmd=None):
+    def __init__(self, port=8000, timeout=30, port_cache=None, validate=True, metrics=None, transport=None):
+        """
+        :param validate: Check commands against the selected application's catalog before sending (see _validate),
+            False for firmware newer than VIAVI/Mts Applications
+        :param metrics: metrics.Metrics for the round trips, default: metrics.default_metrics (disabled until enabled)
+        :param transport: Callable (host, port, timeout) -> connection with write/read_until/close, default
+            telnetlib.Telnet; e.g. transcript.RecordingTransport or transcript.Replay
+        """
+        self.eqpt_ber_ip = '10.10.40.197'
+        self.port = port
+        self.timeout = timeout
+        self.port_cache = port_cache if port_cache is not None else default_port_cache
+        self.validate = validate
+        self._valid_cmds = set()
+        self.metrics = metrics if metrics is not None else default_metrics
+        self.transport = transport if transport is not None else telnetlib.Telnet
+
+        # Session state, re-applied by pool.ManagedMpa2100 after a reconnect
+        self.host = None
+        self.remote_visible = False
+        self.application = None
+        self.session_started = False
+
+    def _read_fields(self, count, timeout=5):
+        """Read ``count`` reply fields from the instrument (see read_fields)"""
+        return read_fields(self.tn, count, timeout)
+
+    def _query(self, command, timeout=5):
+        """Write a (compound) command, return the reply fields as soon as all has arrived
+        :param command: e.g. ":SENSe:DATA? SECOND:TEST:ELAPSED ;:SYSTem:ERRor?"
+        :param timeout: Upper bound in seconds for the reply
+        :return: list of str, one field per query in the command
         """
-        :param status: Includes VIAVI error codes if an "pass" or "fail"
-        :return:
+        self._validate(command)
+        if not self.metrics.enabled:
+            self.tn.write(command.encode("ascii") + b"\n")
+            return self._read_fields(count_queries(command), timeout)
+
+        started = time.perf_counter()
+        self.tn.write(command.encode("ascii") + b"\n")
+        try:
+            fields = self._read_fields(count_queries(command), timeout)
+        except TimeoutError:
+            self.metrics.observe(self.host, command, time.perf_counter() - started, len(command) + 1, 0, timeout=True)
+            raise
+        received = sum(len(field) + 1 for field in fields)
+        self.metrics.observe(self.host, command, time.perf_counter() - started, len(command) + 1, received)
+        return fields
+
+    def _request(self, command, timeout=5):
+        """Write a (compound) command and parse the reply (see scpi.parse_reply)
+        :return: list of typed values, one per query except :SYSTem:ERRor?
+        :raise ScpiError: if a :SYSTem:ERRor? in the command reports an error
         """
-        # if "No error" in status:  # debug
-        if "Error Code" in status:
-            # e.g.: error --> 'Error Code: "-200, "Execution error"'
-            status = status.replace("\n", "")
-            Logger_simple().log(func=function_name, cmd=cmd, msg=f"{repr(status)}")
-
-        # second check sometimes does the error check not working. an reply can look like:
-        # "\n-113, "Undefined header; could not find"
-        error_codes = self.__error_codes()
-        for error_code in error_codes:
-            if error_code in status:
-                status = status.replace("\n", "")
-                Logger_simple().log(func=function_name, cmd=cmd, msg=f"{repr(status)}")
+        fields = self._query(command, timeout)
+        try:
+            return parse_reply(command, fields)
+        except ScpiError as error:
+            self.metrics.error(self.host, command, error.code)
+            raise
 
     # TODO fix - log fd
     #  Telnet.fileno()¶Return the file descriptor of the socket object used internally.
     #  https://docs.python.org/3.7/library/telnetlib.html
 
-    def connect(self, ip):
-        """Connect to SCPI instrument"""
-        #host = self.eqpt_ber_ip
-        host=ip
+    def connect(self, ip, use_cache=True):
+        """Connect to SCPI instrument
+        :param ip: Instrument address
+        :param use_cache: Try the cached BERT port first, run the port discovery only if it fails
+        """
+        host = ip
+        self.host = host
+        if use_cache:
+            port = self.port_cache.get(host, self.port)
+            if port is not None:
+                tn = self._open_cached_port(host, port)
+                if tn is not None:
+                    self.tn = tn
+                    return
+                self.port_cache.invalidate(host, self.port)
+
+        port = self._discover_port(host)
+        self.port_cache.put(host, self.port, port)
+
+        # Telnet no.3 - Get the actual port
+        tn = self.transport(host, port, self.timeout)
+        command = "*REM".encode("ascii") + b"\n"
+        tn.write(command)  # Remote Operational Mode
+        self.tn = tn
+
+    def _discover_port(self, host):
+        """Follow base port -> module port -> BERT port, return: the BERT port e.g. "800x" """
         port = self.port
 
         # Telnet no.1 - Get Second Port
-        tn = telnetlib.Telnet(host, port, self.timeout)
+        tn = self.transport(host, port, self.timeout)
         command = "*REM".encode("ascii") + b"\n"
         tn.write(command)  # Remote Operational Mode
         command = 'MOD:FUNC:PORT? BOTH, BASE, "BERT"'.encode("ascii") + b"\n"
         tn.write(command)  # Query for the module's port number – MOD
-        second_port = tn.read_until(b"****$$$$", timeout=2).decode("ascii").rstrip("\n")  # Result
+        second_port = read_fields(tn, 1, timeout=2)[0]  # Result
         tn.close()
 
         # Telnet no.2 - Get Third Port
         port = second_port  # Second port, e.g. "800x"
-        tn = telnetlib.Telnet(host, port, self.timeout)
+        tn = self.transport(host, port, self.timeout)
         command = "*REM".encode("ascii") + b"\n"
         tn.write(command)  # Remote Operational Mode
         command = ':SYST:FUNC:PORT? BOTH,BASE,"BERT"'.encode("ascii") + b"\n"
         tn.write(command)  # Query for the module's port number – SYST
-        third_port = tn.read_until(b"****$$$$", timeout=2).decode("ascii").rstrip("\n")  # Result
+        third_port = read_fields(tn, 1, timeout=2)[0]  # Result
         tn.close()
+        return third_port
 
-        # Telnet no.3 - Get the actual port
-        port = third_port  # Third port, e.g. "800x"
-        tn = telnetlib.Telnet(host, port, self.timeout)
-        command = "*REM".encode("ascii") + b"\n"
-        tn.write(command)  # Remote Operational Mode
-        self.tn = tn
-
+    def _open_cached_port(self, host, port, timeout=1):
+        """Open a cached BERT port, validated with one :SYSTem:ERRor? round trip
+        :return: Telnet connection in remote mode, None if the port refuses or answers wrongly
+        """
+        try:
+            tn = self.transport(host, port, timeout)
+        except OSError:
+            return None
+        try:
+            tn.write(("*REM\n" + self.SCPI_cmd_sys_error + "\n").encode("ascii"))
+            reply = read_fields(tn, 1, timeout)[0]
+        except (OSError, EOFError, TimeoutError):
+            reply = ""
+        if not re.match(r"[-+]?\d+,", reply):
+            tn.close()
+            return None
+        return tn
 
     def remote_operational_mode(self):
         """Set remote operational mode"""
         command = (
             self.SCPI_cmd_rem_visible + self.SCPI_multiple_cmd_separator + self.SCPI_cmd_sys_error
         )
-        command = command.encode("ascii") + b"\n"
-        self.tn.write(command)
-        status = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(status, inspect.currentframe().f_code.co_name)
+        self._request(command)
+        self.remote_visible = True
 
     def select_running_config(self, port):
         # Get running config
         # *** Call show running config insted...!!!
         command = self.SCPI_cmd_app_cap + self.SCPI_multiple_cmd_separator + self.SCPI_cmd_sys_error
-        self.tn.write(command.encode("ascii") + b"\n")
-        applications_running = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(applications_running, inspect.currentframe().f_code.co_name)
+        applications_running = str(self._request(command)[0])
 
         # Extract the config based on selected port
         pattern = r"\w+_10" + str(port)
@@ -198,11 +415,8 @@ class Mpa2100:
             + self.SCPI_multiple_cmd_separator
             + self.SCPI_cmd_sys_error
         )
-        self.tn.write(command.encode("ascii") + b"\n")
-        status = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(status, inspect.currentframe().f_code.co_name)
+        self._request(command)
+        self.application = application
 
     def remote_session_start(self):
         """Start a remote session on instrument"""
@@ -211,53 +425,46 @@ class Mpa2100:
             + self.SCPI_multiple_cmd_separator
             + self.SCPI_cmd_sys_error
         )
-        command = command.encode("ascii") + b"\n"
-        self.tn.write(command)
-
+        self._request(command)
+        self.session_started = True
 
-    def event_log(self, log=False):
-        """ return: dictionary, key's: status, status_log, status_bool, event_log"""
-        # Note! after the laser is turned on, DUT (e.g. 1610) system is generating an transient (time to time)
-        # and viavi is moved in to the "overload mode" and requires an respond.
+    def read_event_log(self):
+        """return: the test event log as str, one event per line"""
         command = (
             self.SCPI_cmd_event_log_100G_appl
             + self.SCPI_multiple_cmd_separator
             + self.SCPI_cmd_sys_error
         )
-        command = command.encode("ascii") + b"\n"
-        self.tn.write(command)
-        event_log = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(event_log, inspect.currentframe().f_code.co_name)
-
-        helper_status = Status()
-
-        # test
-        if "result" not in event_log:
-            status_dict = helper_status.get_status_dict(return_passed_dict=True)
-        else:
-            status_dict = helper_status.get_status_dict(return_failed_dict=True)
+        return self._request(command)[0]
 
-        # append event log to status dict
-        status_dict.update({"event_log": event_log})
-
-        Logger_simple().log_raw_data(log=log, raw_data_to_log=f"{repr(event_log)}")
+    def event_log(self, log=False):
+        """ return: dictionary, key's: status, status_log, status_bool, event_log"""
+        # Note! after the laser is turned on, DUT (e.g. 1610) system is generating an transient (time to time)
+        # and viavi is moved in to the "overload mode" and requires an respond.
+        # For long runs use event_log.EventLogTail, it parses only the events added since the last poll
+        event_log = self.read_event_log()
+
+        passed = "result" not in event_log
+        status_dict = {
+            "status": "passed" if passed else "failed",
+            "status_log": "Event log without results" if passed else "Event log with results",
+            "status_bool": passed,
+            "event_log": event_log,
+        }
+
+        if log:
+            logger.info("event log: %r", event_log)
         return status_dict
 
     def overload(self):
+        """return: True if the receiver is in overload, None if not available"""
         # force the overload state: - toggle "laser on" sleep 0.5s "laser on" (10-20times). setup: 1610, sfp: 1310.
         # Result = 1 --> overload (overload --> result: "\n1\n0, "No error" no overload --> result: "\n0\n0, "No error")
         # At the moment viavi is not supporting to disable the overload function (not very convenient)
         command = (
             self.SCPI_cmd_overload + self.SCPI_multiple_cmd_separator + self.SCPI_cmd_sys_error
         )
-        self.tn.write(command.encode("ascii") + b"\n")
-        status = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(status, inspect.currentframe().f_code.co_name)
-        return status
+        return self._request(command)[0]
 
     def overload_reset_sfp1(self):
         command = (
@@ -265,11 +472,7 @@ class Mpa2100:
             + self.SCPI_multiple_cmd_separator
             + self.SCPI_cmd_sys_error
         )
-        self.tn.write(command.encode("ascii") + b"\n")
-        reset_overload_sfp1 = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(reset_overload_sfp1, inspect.currentframe().f_code.co_name)
+        self._request(command)
         time.sleep(60)
 
     def overload_reset_sfp2(self):
@@ -278,14 +481,8 @@ class Mpa2100:
             + self.SCPI_multiple_cmd_separator
             + self.SCPI_cmd_sys_error
         )
-        self.tn.write(command.encode("ascii") + b"\n")
-        reset_overload_sfp2 = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        Logger_simple().log_raw_data(
-            raw_data_to_log=f"temp1111111, reset_overload_sfp2: {repr(reset_overload_sfp2)}"
-        )
-        self.__test_status(reset_overload_sfp2, inspect.currentframe().f_code.co_name)
+        reset_overload_sfp2 = self._request(command)
+        logger.debug("reset_overload_sfp2: %r", reset_overload_sfp2)
         time.sleep(60)
 
     # TODO function "overload_reset_sfp" is not working... (quick fix move back to privious solution overload_reset_sfp1, overload_reset_sfp2)
@@ -301,24 +498,14 @@ class Mpa2100:
             + self.SCPI_multiple_cmd_separator
             + self.SCPI_cmd_sys_error
         )
-        self.tn.write(command.encode("ascii") + b"\n")
-        reset_overload_sfp = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        Logger_simple().log_raw_data(
-            raw_data_to_log=f"temp1111111, reset_overload_sfp{port}: {repr(reset_overload_sfp)}"
-        )
-        self.__test_status(reset_overload_sfp, inspect.currentframe().f_code.co_name)
+        reset_overload_sfp = self._request(command)
+        logger.debug("reset_overload_sfp%s: %r", port, reset_overload_sfp)
         time.sleep(60)
 
     def show_running_applications(self):
         """return a list, e.g.: TermEth100GL2Traffic_101, TermEth100GL2Traffic_102"""
         command = self.SCPI_cmd_app_cap + self.SCPI_multiple_cmd_separator + self.SCPI_cmd_sys_error
-        self.tn.write(command.encode("ascii") + b"\n")
-        result = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        #self.__test_status(result, inspect.currentframe().f_code.co_name)
+        result = str(self._request(command)[0])
 
         # extract
         result_list = []
@@ -331,10 +518,11 @@ class Mpa2100:
 
         return result_list
 
-    def close_running_application(self, application):
+    def close_running_application(self, application, wait=True, timeout=None):
         """Select application - Depending on input parameters port and application
         :param port_no: Input form is 1 or 2
         :param application: Input form e.g. "TermEth10GL2Traffic"
+        :param wait: Return when the application is closed (see wait_for_application)
         :return: none
         """
         # TODO: Function works but it I get an error code -200 "Execution error" when closing "TermEth40GL2Traffic"
@@ -345,37 +533,55 @@ class Mpa2100:
             + self.SCPI_multiple_cmd_separator
             + self.SCPI_cmd_sys_error
         )
-        self.tn.write(command.encode("ascii") + b"\n")
-        status = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(status, inspect.currentframe().f_code.co_name)
+        try:
+            self._request(command)
+        except ExecutionError as error:
+            logger.warning("close_running_application: %s", error)
+        self.application = application
 
         # Toggle the laser - assume it's turned on...
         command = (
             self.SCPI_cmd_toggle_laser + self.SCPI_multiple_cmd_separator + self.SCPI_cmd_sys_error
         )
-        self.tn.write(command.encode("ascii") + b"\n")
-        toggle_laser = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(toggle_laser, inspect.currentframe().f_code.co_name)
+        self._request(command)
 
         # Close the application
         command = (
             self.SCPI_cmd_exit_app + self.SCPI_multiple_cmd_separator + self.SCPI_cmd_sys_error
         )
-        self.tn.write(command.encode("ascii") + b"\n")
-        status = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(status, inspect.currentframe().f_code.co_name)
+        self._request(command)
+        self.application = None
 
-        # TODO Replace the sleep below with some better function, waiting for a solution from Viavi (2019-12-20).
-        time.sleep(60)  # Sleep util the application is closed -
+        if wait:
+            self.wait_for_application(application, running=False, timeout=timeout)
 
-    def launch_system_application(self, application):
-        """Launch system application on port"""
+    def wait_for_application(self, application, running=True, timeout=None):
+        """Poll :SYST:APPL:CAPP? until the application is running (or closed), backing off between polls
+        :param application: e.g. "TermEth100GL2Traffic_101", "TermEth40GL2Traffic 1" or "TermEth40GL2Traffic"
+        :param running: Wait for the application to appear (True) or to disappear (False)
+        :param timeout: Upper bound in seconds, default app_wait_timeout
+        :return: seconds waited
+        """
+        timeout = self.app_wait_timeout if timeout is None else timeout
+        command = self.SCPI_cmd_app_cap + self.SCPI_multiple_cmd_separator + self.SCPI_cmd_sys_error
+        start = time.monotonic()
+        delay = self.app_poll_min
+        while True:
+            reply = str(self._request(command)[0])
+            if self._is_running(reply, application) == running:
+                return time.monotonic() - start
+            remaining = start + timeout - time.monotonic()
+            if remaining <= 0:
+                state = "running" if running else "closed"
+                raise TimeoutError(f"{application} not {state} after {timeout}s")
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, self.app_poll_max)
+
+    def launch_system_application(self, application, wait=True, timeout=None):
+        """Launch system application on port
+        :param application: e.g. "TermEth40GL2Traffic 1"
+        :param wait: Return when the application is running (see wait_for_application)
+        """
         # Launch application.
         command = (
             self.SCPI_cmd_launch_app
@@ -384,33 +590,20 @@ class Mpa2100:
             + self.SCPI_multiple_cmd_separator
             + self.SCPI_cmd_sys_error
         )
+        # _request raises ScpiError if the launch is refused
+        self._request(command, timeout=60)
 
-        self.tn.read_until(b"test", timeout=1)
-
-        self.tn.write(command.encode("ascii") + b"\n")
-
-        self.tn.read_until(b"test", timeout= 1)
-
-        #status = (
-        #    self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        #)
-        #self.__test_status(status, inspect.currentframe().f_code.co_name)
+        if wait:
+            self.wait_for_application(application, running=True, timeout=timeout)
 
-        # Verify "in time" when the application is launched.
-        #command = (
-        #    self.SCPI_cmd_verify_app_launched
-        #    + self.SCPI_multiple_cmd_separator
-        #    + self.SCPI_cmd_sys_error
-        #)
-        #self.tn.write(command.encode("ascii") + b"\n")
-        #status = self.tn.read_until(b"_10", timeout=60).decode("ascii").rstrip("\n")
-        #self.__test_status(status, inspect.currentframe().f_code.co_name)
-
-    def select_application(self, application):
+    def select_application(self, application, timeout=0):
         """Select application on port
         :param port_no: Input form is 1 or 2
         :param application: Input form e.g. "TermEth10GL2Traffic"
+        :param timeout: Wait up to timeout seconds for the application to run first (e.g. just launched), 0 no wait
         """
+        if timeout:
+            self.wait_for_application(application, running=True, timeout=timeout)
         # Select application - Depending on input parameters port and application
         command = (
             self.SCPI_cmd_select_app
@@ -419,12 +612,11 @@ class Mpa2100:
             + self.SCPI_multiple_cmd_separator
             + self.SCPI_cmd_sys_error
         )
-        command = command.encode("ascii") + b"\n"
-        self.tn.write(command)
-
+        self._request(command)
+        self.application = application
 
     def read_tx_power(self, trx_type=None):
-        """Read tx power for qsfp or sfp"""
+        """return: tx power for qsfp or sfp, None if not available"""
         if trx_type == "qsfp":
             tx_pow_str = self.SCPI_cmd_read_tx_QSFP
         elif trx_type == "sfp":
@@ -432,24 +624,17 @@ class Mpa2100:
         else:
             raise AttributeError(f"Expected 'sfp' or 'qsfp' transceiver type, got '{trx_type}'")
         command = tx_pow_str + self.SCPI_multiple_cmd_separator + self.SCPI_cmd_sys_error
-        self.tn.write(command.encode("ascii") + b"\n")
-        tx_power = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(tx_power, inspect.currentframe().f_code.co_name)
+        return self._request(command)[0]
 
     def sfp1_present(self):
+        """return: True if a SFP is plugged in slot 1"""
         print(
             'Note, :sense:data? CSTATUS:PHYSICAL:SFP2:PRESENT is not avaleble!!!! I had an return of "1", verify with SFP at slot 2 --> what return???'
         )
         command = (
             self.SCPI_cmd_sfp1_present + self.SCPI_multiple_cmd_separator + self.SCPI_cmd_sys_error
         )
-        self.tn.write(command.encode("ascii") + b"\n")
-        qsfp_tx_power = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(qsfp_tx_power, inspect.currentframe().f_code.co_name)
+        return self._request(command)[0]
 
     def insert_single_code_error(self):
         """Insert single code 'Error' (at Eth)"""
@@ -458,54 +643,38 @@ class Mpa2100:
             + self.SCPI_multiple_cmd_separator
             + self.SCPI_cmd_sys_error
         )
-        command = command.encode("ascii") + b"\n"
-        self.tn.write(command)
-        status = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(status, inspect.currentframe().f_code.co_name)
+        self._request(command)
 
     # Laser (on/off)
     def laser_on(self):
         """Turn laser on"""
         # Note! after the laser is turned on, DUT (e.g. 1610) system is generating an transient (time to time).
         # Use overload (SFP or QSFP) function to handle the transient.
-        status = self.laser_status()
-        if "OFF" in status:
+        if not self.laser_status():
             self.laser_toggle()
 
     def laser_off(self):
         """Turn laser off"""
-        status = self.laser_status()
-        if "ON" in status:
+        if self.laser_status():
             self.laser_toggle()
 
     def laser_status(self):
-        """Check laser status"""
+        """return: True if the laser is on"""
         command = (
             self.SCPI_cmd_laser_status + self.SCPI_multiple_cmd_separator + self.SCPI_cmd_sys_error
         )
-        self.tn.write(command.encode("ascii") + b"\n")
-        status = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(status, inspect.currentframe().f_code.co_name)
-        return status
+        return self._request(command)[0]
 
     def laser_toggle(self):
         """Toggle laser status"""
         command = (
             self.SCPI_cmd_toggle_laser + self.SCPI_multiple_cmd_separator + self.SCPI_cmd_sys_error
         )
-        self.tn.write(command.encode("ascii") + b"\n")
-        status = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(status, inspect.currentframe().f_code.co_name)
+        self._request(command)
 
     def link_status(self):
         """
-        info. when link: \n1\n0 (waiting for link: \n0\n0, fail state: \n9.91e+37\n0)
+        return: True when link (reply \n1\n0, waiting for link: \n0\n0, fail state: \n9.91e+37\n0 -> False)
         note! it's not working for TermEth100GL2Traffic! (working for TermEth10GL2Traffic) sw: 27.1.0
         """
         # TODO fix an solution for TermEth100GL2Traffic, bug? upg inst?
@@ -513,33 +682,23 @@ class Mpa2100:
         command = (
             self.SCPI_cmd_link_status + self.SCPI_multiple_cmd_separator + self.SCPI_cmd_sys_error
         )
-        self.tn.write(command.encode("ascii") + b"\n")
-        status = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(status, inspect.currentframe().f_code.co_name)
-        Logger_simple().log(msg=f"*** {repr(status)}")
-        Logger_simple().log(msg=f"*** {status}")
-        if "\n1\n" in status:
-            status_bool = True
-        else:
-            status_bool = False
-
-        return status_bool
+        status = self._request(command)[0]
+        logger.debug("link_status: %r", status)
+        return status is True
 
     # traffic - FC (start/stop)
     def traffic_fc_start(self):
         """Start fc traffic"""
         status = self.traffic_fc_status()
         print("status", status)
-        if "OFF" in status:
+        if not status:
             self.traffic_fc_toggle()
 
     def traffic_fc_stop(self):
         """Stop fc traffic"""
         status = self.traffic_fc_status()
         print("status", status)
-        if "ON" in status:
+        if status:
             self.traffic_fc_toggle()
 
     def traffic_fc_status(self):
@@ -549,13 +708,7 @@ class Mpa2100:
             + self.SCPI_multiple_cmd_separator
             + self.SCPI_cmd_sys_error
         )
-        command = command.encode("ascii") + b"\n"
-        self.tn.write(command)
-        status = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(status, inspect.currentframe().f_code.co_name)
-        return status  # 'ON' or 'OFF'
+        return self._request(command)[0]  # True (ON) or False (OFF)
 
     def traffic_fc_toggle(self):
         """Toggle fc traffic status"""
@@ -564,24 +717,17 @@ class Mpa2100:
             + self.SCPI_multiple_cmd_separator
             + self.SCPI_cmd_sys_error
         )
-        command = command.encode("ascii") + b"\n"
-        self.tn.write(command)
-        status = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(status, inspect.currentframe().f_code.co_name)
+        self._request(command)
 
     # traffic - Eth, SDH (start/stop)
     def traffic_mac_start(self):
         # Note! after the laser is turned on, DUT (e.g. 1610) system is generating an transient (time to time)
         # and viavi is moved in to the "overload mode" and requires an respond.
-        status = self.traffic_mac_status()
-        if "OFF" in status:
+        if not self.traffic_mac_status():
             self.traffic_mac_toggle()
 
     def traffic_mac_stop(self):
-        status = self.traffic_mac_status()
-        if "ON" in status:
+        if self.traffic_mac_status():
             self.traffic_mac_toggle()
 
     def traffic_mac_status(self):
@@ -590,13 +736,7 @@ class Mpa2100:
             + self.SCPI_multiple_cmd_separator
             + self.SCPI_cmd_sys_error
         )
-        command = command.encode("ascii") + b"\n"
-        self.tn.write(command)
-        status = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(status, inspect.currentframe().f_code.co_name)
-        return status  # 'ON' or 'OFF'
+        return self._request(command)[0]  # True (ON) or False (OFF)
 
     def traffic_mac_toggle(self):
         command = (
@@ -604,12 +744,7 @@ class Mpa2100:
             + self.SCPI_multiple_cmd_separator
             + self.SCPI_cmd_sys_error
         )
-        command = command.encode("ascii") + b"\n"
-        self.tn.write(command)
-        status = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(status, inspect.currentframe().f_code.co_name)
+        self._request(command)
 
     # test (start, stop and restart the test)
     def test_restart(self):
@@ -625,12 +760,7 @@ class Mpa2100:
             + self.SCPI_multiple_cmd_separator
             + self.SCPI_cmd_sys_error
         )
-        command = command.encode("ascii") + b"\n"
-        self.tn.write(command)
-        status = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(status, inspect.currentframe().f_code.co_name)
+        self._request(command)
 
     def test_start(self):
         # corresponds to the "start/stop test button" at the GUI (no toggle, use different commands, e.g. :INITiate).
@@ -639,11 +769,7 @@ class Mpa2100:
             + self.SCPI_multiple_cmd_separator
             + self.SCPI_cmd_sys_error
         )
-        self.tn.write(command.encode("ascii") + b"\n")
-        status = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(status, inspect.currentframe().f_code.co_name)
+        self._request(command)
         time.sleep(1)  # wait until the laser is up running (before other actions)
 
     # *** To be replaced...
@@ -674,25 +800,16 @@ class Mpa2100:
         status = self.tn.read_until(self.read_until_error_free, timeout=5).decode('ascii').rstrip('\n')
         self.__test_status(status, inspect.currentframe().f_code.co_name)
         """
-        tn = self.tn
         command = ":SYSTem:REBoot"
 
-        self.tn.write(command.encode("ascii") + b"\n")
-
-        status = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        self.__test_status(status, inspect.currentframe().f_code.co_name)
+        self._request(command)
 
     def remote_session_end(self):
         command = (
             self.SCPI_cmd_end_session + self.SCPI_multiple_cmd_separator + self.SCPI_cmd_sys_error
         )
-        self.tn.write(command.encode("ascii") + b"\n")
-        status = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
-        #self.__test_status(status, inspect.currentframe().f_code.co_name)
+        self._request(command)
+        self.session_started = False
 
     def close(self):
         self.tn.close()
@@ -701,46 +818,34 @@ class Mpa2100:
         command = (
             ':SYSTem:APPLication:SELect TermEth40GL2Traffic_102'
         )
-        self.tn.write(command.encode("ascii") + b"\n")
-
-        result = (
-            self.tn.read_until(self.read_until_error_free, timeout=5).decode("ascii").rstrip("\n")
-        )
+        result = "\n".join(self._query(command))
         return result
 
     def read_i2c(self, page, address):
 
         page= str(page)
 
-        command = (
-                ':SENSE:EXPERT:I2C:PEEK:PAGESEL ' + page
-        )
-        self.tn.write(command.encode("ascii") + b"\n")
         address=str(address)
+        # PAGESEL has no reply, in the same line as REGADDR (see read_i2c_block)
         command = (
-                ':SENSE:EXPERT:I2C:PEEK:REGADDR ' + address
+                self.SCPI_cmd_i2c_peek_pagesel + " " + page
+                + self.SCPI_multiple_cmd_separator
+                + self.SCPI_cmd_i2c_peek_regaddr + " " + address
                 + self.SCPI_multiple_cmd_separator
                 + self.SCPI_cmd_sys_error
         )
-        self.tn.write(command.encode("ascii") + b"\n")
+        self._request(command)
         command = (
-                ':SENSE:EXPERT:I2C:PEEK:Trigger'
+                self.SCPI_cmd_i2c_peek_trigger
                 + self.SCPI_multiple_cmd_separator
                 + self.SCPI_cmd_sys_error
         )
-        self.tn.write(command.encode("ascii") + b"\n")
-
-        command = (
-            ':SENSe:DATA? :SENSE:EXPERT:I2C:PEEK:REGDATA'
-        )
+        self._request(command)
 
-        self.tn.read_until(b"test",timeout=1).decode("ascii").rstrip("\n")
+        command = self.SCPI_cmd_i2c_peek_regdata
 
-        self.tn.write(command.encode("ascii") + b"\n")
-        result_str = self.tn.read_until(b"test", timeout=1).decode("ascii").rstrip("\n")
-        print(result_str)
+        result_int = self._request(command)[0]
 
-        result_int = int(result_str)
         result_hex = hex(result_int).lstrip("0x")
 
         if len(result_hex) == 0:
@@ -753,158 +858,145 @@ class Mpa2100:
         return result_hex
 
 
-    def i2c_read_page_qsfp(self, page):
+    def read_i2c_block(self, page, address, length):
+        """Read consecutive I2C registers with one PAGESEL and pipelined PEEK sequences
+        :param page: Page select value, e.g. 0 or 32 (0x20)
+        :param address: First register address
+        :param length: Number of registers to read
+        :return: bytes, one per register
+        """
+        # One line per register: REGADDR, Trigger and the REGDATA query -> a single reply field
+        commands = [
+            (
+                self.SCPI_cmd_i2c_peek_regaddr
+                + " "
+                + str(address + i)
+                + self.SCPI_multiple_cmd_separator
+                + self.SCPI_cmd_i2c_peek_trigger
+                + self.SCPI_multiple_cmd_separator
+                + self.SCPI_cmd_i2c_peek_regdata
+            ).encode("ascii")
+            + b"\n"
+            for i in range(length)
+        ]
 
+        if commands:
+            self._validate(commands[0].decode("ascii"))
+            # PAGESEL has no reply: sent on its own, Nagle holds the first PEEK line back until the instrument ACKs
+            # it (delayed ACK, ~40 ms), so it goes out in the same write as the first sequences
+            commands[0] = (self.SCPI_cmd_i2c_peek_pagesel + " " + str(page) + "\n").encode("ascii") + commands[0]
+
+        # Keep up to i2c_pipeline_depth sequences in flight, read the replies in order
+        started = time.perf_counter()
+        data = bytearray()
+        sent = 0
+        received = 0
+        try:
+            while len(data) < length:
+                in_flight = sent - len(data)
+                if sent < length and in_flight < self.i2c_pipeline_depth:
+                    chunk = commands[sent : len(data) + self.i2c_pipeline_depth]
+                    self.tn.write(b"".join(chunk))
+                    sent += len(chunk)
+                field = self._read_fields(1)[0]
+                received += len(field) + 1
+                data.append(int(field))
+        except (ValueError, TimeoutError) as error:
+            if self.metrics.enabled:
+                self.metrics.observe(
+                    self.host,
+                    "read_i2c_block",
+                    time.perf_counter() - started,
+                    sum(map(len, commands[:sent])),
+                    received,
+                    timeout=isinstance(error, TimeoutError),
+                )
+            # Discard the replies of the sequences still in flight, the next query must not read them
+            try:
+                self._read_fields(sent - len(data) - 1)
+            except TimeoutError:
+                pass
+            raise
+        if self.metrics.enabled:
+            # The pipelined registers have no latency of their own, the block counts as one round trip
+            self.metrics.observe(
+                self.host, "read_i2c_block", time.perf_counter() - started, sum(map(len, commands)), received
+            )
+
+        # Error check for the whole block: empty the queue (up to one error per sequence), raise the first error
+        errors = []
+        while True:
+            try:
+                self._request(self.SCPI_cmd_sys_error)
+                break
+            except ScpiError as error:
+                errors.append(error)
+        if errors:
+            raise errors[0]
+        return bytes(data)
+
+    def i2c_read_page_qsfp(self, page, cache=None):
+        """Read and print one QSFP page (lower page for "BasePage", else upper page 80h-FFh)
+        :param cache: eeprom_cache.EepromCache, static upper pages are then read from the cache when valid
+        :return: bytes, 128 registers
+        """
         if page == "BasePage":
             print('Base page: ')
-            page=0
-
-            col = 0
-            s = "00: "
-            row = 0
-            print("    00 01 02 03 04 05 06 07 08 09 0A 0B 0C 0D 0E 0F")
-
-            for i in range(128):
-                col = col + 1
-                s = s + self.read_i2c(page, i) + " "
-                if col == 16:
-                    print((s))
-                    col = 0
-                    row = row + 1
-                    if row == 10:
-                        s = "A0" + ": "
-                    elif row == 11:
-                        s = "B0" + ": "
-                    elif row == 12:
-                        s = "C0" + ": "
-                    elif row == 13:
-                        s = "D0" + ": "
-                    elif row == 14:
-                        s = "E0" + ": "
-                    elif row == 15:
-                        s = "F0" + ": "
-                    else:
-                        s = str(row) + "0: "
+            first_address = 0
+            data = self.read_i2c_block(0, first_address, 128)
         else:
             print("Page " + str(page) + ":")
-            col = 0
-            s = "80: "
-            row = 8
-            print("    00 01 02 03 04 05 06 07 08 09 0A 0B 0C 0D 0E 0F")
-
-            for i in range(128):
-                col = col + 1
-                s = s + self.read_i2c(page, 128 + i) + " "
-                if col == 16:
-                    print((s))
-                    col = 0
-                    row = row + 1
-                    if row == 10:
-                        s = "A0" + ": "
-                    elif row == 11:
-                        s = "B0" + ": "
-                    elif row == 12:
-                        s = "C0" + ": "
-                    elif row == 13:
-                        s = "D0" + ": "
-                    elif row == 14:
-                        s = "E0" + ": "
-                    elif row == 15:
-                        s = "F0" + ": "
-                    else:
-                        s = str(row) + "0: "
-
-    def read_pre_fec_ber_INPHI(self):
-        byte_164 = self.read_i2c(32, 182)
-        byte_165 = self.read_i2c(32, 183)
-
-
-        # Code to convert hex to binary
-        res = "{0:016b}".format(int(byte_164 + byte_165, 16))
-
+            first_address = 128
+            if cache is not None:
+                data = cache.read_page(self, page)
+            else:
+                data = self.read_i2c_block(page, first_address, 128)
 
-        #exponent = res[:5]
-        #mantissa = res[5:]
+        print(format_page(data, first_address))
+        return data
 
-        # From string in binary to decimal
-
-        sumExponent = 0
-        sumMantissa = 0
-
-        for i in range(16):
-            if i < 5:
-                sumExponent = int(res[i]) * 2 ** (4 - i) + sumExponent
-            if i >= 5:
-                sumMantissa = int(res[i]) * 2 ** (15 - i) + sumMantissa
-
-        if sumMantissa >= 1000:
-            print(str(sumMantissa / 1000), "E", str(sumExponent - 21))
-        else:
-            print(str(sumMantissa), "E", str(sumExponent - 24))
+    def read_pre_fec_ber_INPHI(self):
+        """return: pre-FEC BER as float, page 20h bytes 182-183 (B6-B7)"""
+        return decode_pre_fec_ber(int.from_bytes(self.read_i2c_block(32, 182, 2), "big"))
 
     def read_pre_fec_ber_Eopto(self):
-        byte_158 = self.read_i2c(32, 158)
-        byte_159 = self.read_i2c(32, 159)
-
-
-        # Code to convert hex to binary
-        res = "{0:016b}".format(int(byte_158 + byte_159, 16))
-
-
-        #exponent = res[:5]
-        #mantissa = res[5:]
-
-        # From string in binary to decimal
-
-        sumExponent = 0
-        sumMantissa = 0
-
-        for i in range(16):
-            if i < 5:
-                sumExponent = int(res[i]) * 2 ** (4 - i) + sumExponent
-            if i >= 5:
-                sumMantissa = int(res[i]) * 2 ** (15 - i) + sumMantissa
+        """return: pre-FEC BER as float, page 20h bytes 158-159 (9E-9F)"""
+        return decode_pre_fec_ber(int.from_bytes(self.read_i2c_block(32, 158, 2), "big"))
 
-        if sumMantissa >= 1000:
-            print(str(sumMantissa / 1000), "E", str(sumExponent - 21))
-        else:
-            print(str(sumMantissa), "E", str(sumExponent - 24))
+    def read_ddm(self):
+        """return: digital diagnostics (temperature, Vcc, per lane rx power, tx bias, tx power) in SI units as a
+        ddm.DDM record, read as one block of lower page bytes 22-57
+        """
+        return ddm.decode_ddm(self.read_i2c_block(0, ddm.FIRST_ADDRESS, ddm.LENGTH))
 
     def read_Rx_power(self):
-        command=self.SCPI_cmd_read_rx_QSFP
-
-        # Empty buffert
-        self.tn.read_until(b"hello", timeout=0.5).decode("ascii").rstrip("\n")
-
-        self.tn.write(command.encode("ascii") + b"\n")
-        result_str = self.tn.read_until(b"test", timeout=0.5).decode("ascii").rstrip("\n")
-        return result_str
+        """return: QSFP rx power sum as float, None if not available"""
+        return self._request(self.SCPI_cmd_read_rx_QSFP)[0]
 
     def error_present(self):
-        command = self.SCPI_cmd_error_seconds
-        self.tn.read_until(b"hello", timeout=0.5).decode("ascii").rstrip("\n")
-
-        self.tn.write(command.encode("ascii") + b"\n")
-        result_str = self.tn.read_until(b"test", timeout=0.5).decode("ascii").rstrip("\n")
-
-        return result_str
+        """return: error seconds as int, None if not available"""
+        return self._request(self.SCPI_cmd_error_seconds)[0]
 
     def test_time(self):
-        command = self.SCPI_cmd_time_elapsed
-
-        self.tn.read_until(b"hello", timeout=0.5).decode("ascii").rstrip("\n")
-
-        self.tn.write(command.encode("ascii") + b"\n")
-        result_str = self.tn.read_until(b"test", timeout=0.5).decode("ascii").rstrip("\n")
-
-        return result_str
-
-
-
-
-
-
-
-
-
-
+        """return: elapsed test time in seconds as int, None if not available"""
+        return self._request(self.SCPI_cmd_time_elapsed)[0]
+
+    def query_many(self, queries, timeout=5):
+        """Send several queries as one compound command, i.e. one write and one round trip
+        :param queries: Query commands, e.g. [SCPI_cmd_read_rx_QSFP, SCPI_cmd_time_elapsed]
+        :param timeout: Upper bound in seconds for the whole reply
+        :return: list of typed values, one per query (see scpi.parse_reply)
+        :raise ScpiError: if the instrument reports an error
+        """
+        queries = list(queries)
+        for query in queries:
+            if count_queries(query) != 1:
+                raise AttributeError(f"Expected a single query, got '{query}'")
+        command = self.SCPI_multiple_cmd_separator.join(queries + [self.SCPI_cmd_sys_error])
+        return self._request(command, timeout)
+
+    def read_soak_sample(self):
+        """return: tuple (rx_power, time_elapsed, error_seconds) read in one round trip"""
+        return tuple(
+            self.query_many([self.SCPI_cmd_read_rx_QSFP, self.SCPI_cmd_time_elapsed, self.SCPI_cmd_error_seconds])
+        )
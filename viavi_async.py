@@ -0,0 +1,441 @@
+"""
+========================================================================================================================
+# Information
+asyncio version of viavi.Mpa2100. Uses asyncio streams instead of blocking telnetlib, so one event loop can drive
+many MTS/MPA instruments concurrently, e.g.:
+
+    async def main():
+        instruments = [AsyncMpa2100() for _ in hosts]
+        await asyncio.gather(*(a.connect(host) for a, host in zip(instruments, hosts)))
+        print(await asyncio.gather(*(a.read_Rx_power() for a in instruments)))
+========================================================================================================================
+"""
+
+import asyncio
+import logging
+import re
+import time
+
+import ddm
+from metrics import default_metrics
+from scpi import ExecutionError, ScpiError, parse_reply
+from viavi import Mpa2100Commands, count_queries, default_port_cache, format_page
+
+logger = logging.getLogger(__name__)
+
+
+async def read_fields(reader, count, timeout=5):
+    """Read newline terminated reply fields, return as soon as ``count`` fields has arrived
+    :param reader: asyncio.StreamReader
+    :param count: Number of (non empty) fields to wait for
+    :param timeout: Upper bound in seconds for all fields
+    :return: list of str
+    """
+    fields = []
+    lines = []  # of the field in progress, joined once complete
+    quotes = 0
+    deadline = time.monotonic() + timeout
+    while len(fields) < count:
+        try:
+            line = await asyncio.wait_for(reader.readline(), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            line = b""
+        if not line.endswith(b"\n"):
+            received = fields + ["".join(lines) + line.decode("ascii")]
+            await drain(reader)
+            raise TimeoutError(f"Expected {count} reply fields within {timeout}s, got {received}")
+        line = line.decode("ascii")
+        lines.append(line)
+        # A quoted string (e.g. the event log) can span several lines
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        field = "".join(lines).strip()
+        lines = []
+        quotes = 0
+        if field:
+            fields.append(field)
+    return fields
+
+
+async def drain(reader, settle=0.1):
+    """Discard pending input, until nothing arrived for ``settle`` seconds (see viavi.drain)
+    :param reader: asyncio.StreamReader
+    :return: bytes discarded
+    """
+    discarded = b""
+    while True:
+        try:
+            data = await asyncio.wait_for(reader.read(4096), settle)
+        except asyncio.TimeoutError:
+            return discarded
+        if not data:
+            return discarded
+        discarded += data
+
+
+class AsyncMpa2100(Mpa2100Commands):
+    """asyncio class for Instrument Mpa2100 (viavi), every method is a coroutine"""
+
+    def __init__(self, port=8000, timeout=30, port_cache=None, validate=True, metrics=None):
+        """
+        :param validate: Check commands against the selected application's catalog before sending
+        :param metrics: metrics.Metrics for the round trips, default: metrics.default_metrics
+        """
+        self.port = port
+        self.timeout = timeout
+        self.port_cache = port_cache if port_cache is not None else default_port_cache
+        self.validate = validate
+        self._valid_cmds = set()
+        self.metrics = metrics if metrics is not None else default_metrics
+        self.host = None
+        self.application = None
+        self.reader = None
+        self.writer = None
+        # One request/reply in flight per connection
+        self.lock = asyncio.Lock()
+
+    async def _open(self, host, port):
+        return await asyncio.wait_for(asyncio.open_connection(host, int(port)), self.timeout)
+
+    async def _query(self, command, timeout=5):
+        """Write a (compound) command, return the reply fields as soon as all has arrived"""
+        self._validate(command)
+        async with self.lock:
+            started = time.perf_counter()
+            self.writer.write(command.encode("ascii") + b"\n")
+            await self.writer.drain()
+            if not self.metrics.enabled:
+                return await read_fields(self.reader, count_queries(command), timeout)
+            try:
+                fields = await read_fields(self.reader, count_queries(command), timeout)
+            except TimeoutError:
+                self.metrics.observe(
+                    self.host, command, time.perf_counter() - started, len(command) + 1, 0, timeout=True
+                )
+                raise
+        received = sum(len(field) + 1 for field in fields)
+        self.metrics.observe(self.host, command, time.perf_counter() - started, len(command) + 1, received)
+        return fields
+
+    async def _request(self, command, timeout=5):
+        """Write a (compound) command and parse the reply (see scpi.parse_reply)"""
+        fields = await self._query(command, timeout)
+        try:
+            return parse_reply(command, fields)
+        except ScpiError as error:
+            self.metrics.error(self.host, command, error.code)
+            raise
+
+    async def _command(self, command, timeout=5):
+        """Write command + :SYSTem:ERRor?
+        :return: typed value of the query (e.g. :OUTPUT:OPTIC?), None for a setting command
+        :raise ScpiError: if the instrument reports an error
+        """
+        values = await self._request(command + self.SCPI_multiple_cmd_separator + self.SCPI_cmd_sys_error, timeout)
+        return values[0] if values else None
+
+    async def connect(self, ip, use_cache=True):
+        """Connect to SCPI instrument (cached BERT port or base port -> module port -> BERT port, as Mpa2100.connect)"""
+        host = ip
+        self.host = host
+        if use_cache:
+            port = self.port_cache.get(host, self.port)
+            if port is not None and await self._open_cached_port(host, port):
+                return
+            self.port_cache.invalidate(host, self.port)
+
+        port = await self._discover_port(host)
+        self.port_cache.put(host, self.port, port)
+
+        # Connection no.3 - Get the actual port
+        self.reader, self.writer = await self._open(host, port)
+        self.writer.write(b"*REM\n")
+        await self.writer.drain()
+
+    async def _discover_port(self, host):
+        """Follow base port -> module port -> BERT port, return: the BERT port e.g. "800x" """
+        # Connection no.1 - Get Second Port
+        reader, writer = await self._open(host, self.port)
+        writer.write(b"*REM\n" + b'MOD:FUNC:PORT? BOTH, BASE, "BERT"\n')
+        second_port = (await read_fields(reader, 1, timeout=2))[0]
+        writer.close()
+        await writer.wait_closed()
+
+        # Connection no.2 - Get Third Port
+        reader, writer = await self._open(host, second_port)
+        writer.write(b"*REM\n" + b':SYST:FUNC:PORT? BOTH,BASE,"BERT"\n')
+        third_port = (await read_fields(reader, 1, timeout=2))[0]
+        writer.close()
+        await writer.wait_closed()
+        return third_port
+
+    async def _open_cached_port(self, host, port, timeout=1):
+        """Open a cached BERT port, validated with one :SYSTem:ERRor? round trip
+        :return: True if connected, False if the port refuses or answers wrongly
+        """
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        try:
+            writer.write(("*REM\n" + self.SCPI_cmd_sys_error + "\n").encode("ascii"))
+            reply = (await read_fields(reader, 1, timeout))[0]
+        except (OSError, EOFError, TimeoutError):
+            reply = ""
+        if not re.match(r"[-+]?\d+,", reply):
+            writer.close()
+            await writer.wait_closed()
+            return False
+        self.reader, self.writer = reader, writer
+        return True
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+    async def remote_operational_mode(self):
+        """Set remote operational mode"""
+        await self._command(self.SCPI_cmd_rem_visible)
+
+    async def remote_session_start(self):
+        """Start a remote session on instrument"""
+        await self._command(self.SCPI_cmd_create_new_session)
+
+    async def remote_session_end(self):
+        await self._command(self.SCPI_cmd_end_session)
+
+    async def show_running_applications(self):
+        """return a list, e.g.: TermEth100GL2Traffic_101, TermEth100GL2Traffic_102"""
+        result = str(await self._command(self.SCPI_cmd_app_cap))
+        result_list = []
+        for pattern in (r"\w+_101", r"\w+_102"):
+            application = re.findall(pattern, result)
+            if application:
+                result_list.append(application[0])
+        return result_list
+
+    async def wait_for_application(self, application, running=True, timeout=None):
+        """Poll :SYST:APPL:CAPP? until the application is running (or closed), see Mpa2100.wait_for_application
+        :return: seconds waited
+        """
+        timeout = self.app_wait_timeout if timeout is None else timeout
+        command = self.SCPI_cmd_app_cap + self.SCPI_multiple_cmd_separator + self.SCPI_cmd_sys_error
+        start = time.monotonic()
+        delay = self.app_poll_min
+        while True:
+            reply = str((await self._request(command))[0])
+            if self._is_running(reply, application) == running:
+                return time.monotonic() - start
+            remaining = start + timeout - time.monotonic()
+            if remaining <= 0:
+                state = "running" if running else "closed"
+                raise TimeoutError(f"{application} not {state} after {timeout}s")
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, self.app_poll_max)
+
+    async def launch_system_application(self, application, wait=True, timeout=None):
+        """Launch system application on port, e.g. "TermEth40GL2Traffic 1", by default return when it is running"""
+        await self._command(self.SCPI_cmd_launch_app + " " + application, timeout=60)
+        if wait:
+            await self.wait_for_application(application, running=True, timeout=timeout)
+
+    async def select_application(self, application, timeout=0):
+        """Select application on port, e.g. "TermEth10GL2Traffic_101"
+        :param timeout: Wait up to timeout seconds for the application to run first (e.g. just launched), 0 no wait
+        """
+        if timeout:
+            await self.wait_for_application(application, running=True, timeout=timeout)
+        await self._command(self.SCPI_cmd_select_app + " " + application)
+        self.application = application
+
+    async def close_running_application(self, application, wait=True, timeout=None):
+        """Select the application, toggle the laser off, exit it and by default return when it is closed"""
+        try:
+            await self._command(self.SCPI_cmd_select_app + " " + application)
+        except ExecutionError as error:
+            logger.warning("close_running_application: %s", error)
+        self.application = application
+        await self._command(self.SCPI_cmd_toggle_laser)
+        await self._command(self.SCPI_cmd_exit_app)
+        self.application = None
+        if wait:
+            await self.wait_for_application(application, running=False, timeout=timeout)
+
+    # I2C
+    async def read_i2c(self, page, address):
+        """return: one I2C register as two hex digits, e.g. "0d" """
+        data = await self.read_i2c_block(page, address, 1)
+        return f"{data[0]:02x}"
+
+    async def read_i2c_block(self, page, address, length):
+        """Read consecutive I2C registers with one PAGESEL and pipelined PEEK sequences (see Mpa2100.read_i2c_block)
+        A timeout, a bad reply or a cancellation mid-pipeline closes the connection, the replies still in flight
+        would be read by the next query; connect again before the next call.
+        :return: bytes, one per register
+        """
+        commands = [
+            (
+                self.SCPI_cmd_i2c_peek_regaddr
+                + " "
+                + str(address + i)
+                + self.SCPI_multiple_cmd_separator
+                + self.SCPI_cmd_i2c_peek_trigger
+                + self.SCPI_multiple_cmd_separator
+                + self.SCPI_cmd_i2c_peek_regdata
+            ).encode("ascii")
+            + b"\n"
+            for i in range(length)
+        ]
+        if commands:
+            self._validate(commands[0].decode("ascii"))
+            # PAGESEL in the same write as the first sequences, no Nagle stall (see Mpa2100.read_i2c_block)
+            commands[0] = (self.SCPI_cmd_i2c_peek_pagesel + " " + str(page) + "\n").encode("ascii") + commands[0]
+        data = bytearray()
+        sent = 0
+        received = 0
+        async with self.lock:
+            started = time.perf_counter()
+            try:
+                while len(data) < length:
+                    if sent < length and sent - len(data) < self.i2c_pipeline_depth:
+                        chunk = commands[sent : len(data) + self.i2c_pipeline_depth]
+                        self.writer.write(b"".join(chunk))
+                        await self.writer.drain()
+                        sent += len(chunk)
+                    field = (await read_fields(self.reader, 1))[0]
+                    received += len(field) + 1
+                    data.append(int(field))
+            except (asyncio.CancelledError, TimeoutError, ValueError) as error:
+                if self.metrics.enabled and not isinstance(error, asyncio.CancelledError):
+                    self.metrics.observe(
+                        self.host,
+                        "read_i2c_block",
+                        time.perf_counter() - started,
+                        sum(map(len, commands[:sent])),
+                        received,
+                        timeout=isinstance(error, TimeoutError),
+                    )
+                self.writer.close()
+                raise
+        if self.metrics.enabled:
+            self.metrics.observe(
+                self.host, "read_i2c_block", time.perf_counter() - started, sum(map(len, commands)), received
+            )
+        # Empty the error queue, raise the first error (see Mpa2100.read_i2c_block)
+        errors = []
+        while True:
+            try:
+                await self._request(self.SCPI_cmd_sys_error)
+                break
+            except ScpiError as error:
+                errors.append(error)
+        if errors:
+            raise errors[0]
+        return bytes(data)
+
+    async def i2c_read_page_qsfp(self, page):
+        """Read and print one QSFP page (lower page for "BasePage", else upper page 80h-FFh)
+        :return: bytes, 128 registers
+        """
+        if page == "BasePage":
+            first_address = 0
+            data = await self.read_i2c_block(0, first_address, 128)
+            print("Base page: ")
+        else:
+            first_address = 128
+            data = await self.read_i2c_block(page, first_address, 128)
+            print("Page " + str(page) + ":")
+        print(format_page(data, first_address))
+        return data
+
+    # Measurements
+    async def read_ddm(self):
+        """return: digital diagnostics as a ddm.DDM record (see Mpa2100.read_ddm)"""
+        return ddm.decode_ddm(await self.read_i2c_block(0, ddm.FIRST_ADDRESS, ddm.LENGTH))
+
+    async def read_Rx_power(self):
+        return (await self._request(self.SCPI_cmd_read_rx_QSFP))[0]
+
+    async def error_present(self):
+        return (await self._request(self.SCPI_cmd_error_seconds))[0]
+
+    async def test_time(self):
+        return (await self._request(self.SCPI_cmd_time_elapsed))[0]
+
+    async def query_many(self, queries, timeout=5):
+        """Send several queries as one compound command (see Mpa2100.query_many)
+        :return: list of typed values, one per query
+        """
+        queries = list(queries)
+        for query in queries:
+            if count_queries(query) != 1:
+                raise AttributeError(f"Expected a single query, got '{query}'")
+        return await self._request(self.SCPI_multiple_cmd_separator.join(queries + [self.SCPI_cmd_sys_error]), timeout)
+
+    async def read_soak_sample(self):
+        """return: tuple (rx_power, time_elapsed, error_seconds) read in one round trip"""
+        return tuple(
+            await self.query_many([self.SCPI_cmd_read_rx_QSFP, self.SCPI_cmd_time_elapsed, self.SCPI_cmd_error_seconds])
+        )
+
+    # Laser (on/off)
+    async def laser_status(self):
+        """return: True if the laser is on"""
+        return await self._command(self.SCPI_cmd_laser_status)
+
+    async def laser_toggle(self):
+        """Toggle laser status"""
+        await self._command(self.SCPI_cmd_toggle_laser)
+
+    async def laser_on(self):
+        """Turn laser on"""
+        if not await self.laser_status():
+            await self.laser_toggle()
+
+    async def laser_off(self):
+        """Turn laser off"""
+        if await self.laser_status():
+            await self.laser_toggle()
+
+    # traffic - Eth, SDH (start/stop)
+    async def traffic_mac_status(self):
+        return await self._command(self.SCPI_cmd_read_traffic_button_status)
+
+    async def traffic_mac_toggle(self):
+        await self._command(self.SCPI_cmd_toggle_traffic)
+
+    async def traffic_mac_start(self):
+        if not await self.traffic_mac_status():
+            await self.traffic_mac_toggle()
+
+    async def traffic_mac_stop(self):
+        if await self.traffic_mac_status():
+            await self.traffic_mac_toggle()
+
+    # traffic - FC (start/stop)
+    async def traffic_fc_status(self):
+        return await self._command(self.SCPI_cmd_read_traffic_fchannel_button_status)
+
+    async def traffic_fc_toggle(self):
+        await self._command(self.SCPI_cmd_toggle_traffic_fchannel)
+
+    async def traffic_fc_start(self):
+        if not await self.traffic_fc_status():
+            await self.traffic_fc_toggle()
+
+    async def traffic_fc_stop(self):
+        if await self.traffic_fc_status():
+            await self.traffic_fc_toggle()
+
+    # test (start, stop and restart the test)
+    async def test_stop(self):
+        await self._command(self.SCPI_cmd_reset_stop_test)
+
+    async def test_start(self):
+        await self._command(self.SCPI_cmd_reset_start_test)
+        await asyncio.sleep(1)  # wait until the laser is up running (before other actions)
+
+    async def test_restart(self):
+        await self.test_stop()
+        await self.test_start()
@@ -0,0 +1,217 @@
+"""
+========================================================================================================================
+# Information
+Watch a live sample stream (sampler.Sampler) for conditions and react with actions. A condition is evaluated on every
+sample, has hysteresis (it fires when the trigger level is crossed and re-arms only when the clear level is crossed
+back) and runs its actions once per firing, in the sampling loop, i.e. before the next sample is read. The reaction
+latency, from the end of the read of the sample to the end of the actions, is measured per condition.
+
+    sampler = Sampler(lambda: dict(zip(("rx_power", "time_elapsed", "error_seconds"), a.read_soak_sample())), 1)
+    watcher = Watcher()
+    watcher.add(Threshold("error_seconds", above=1), lambda event: sampler.stop())
+    watcher.add(Threshold("rx_power", below=-10, clear=-8), lambda event: a.laser_toggle())
+    watcher.add(RateOfChange("rx_power", 0.5), lambda event: snapshots.append(Snapshot.capture(a)))
+    watcher.run(sampler)
+    print(watcher.events, watcher.latency_report())
+========================================================================================================================
+"""
+
+import collections
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Condition:
+    """Base class: ``evaluate`` returns True (trigger), False (clear) or None (no change, e.g. value missing)"""
+
+    def __init__(self, key, name=None):
+        """
+        :param key: Key of the value in the sample values, e.g. "rx_power"
+        :param name: Name in the events, default: class name and key
+        """
+        self.key = key
+        self.name = name or f"{type(self).__name__}({key})"
+        self.active = False
+
+    def evaluate(self, value, sample):
+        raise NotImplementedError
+
+    def update(self, sample):
+        """Evaluate a sample, return: True if the condition fires with this sample (inactive -> active)"""
+        values = sample["values"]
+        value = values.get(self.key) if isinstance(values, dict) else None
+        if value is None:
+            return False
+        state = self.evaluate(value, sample)
+        if state is None or state == self.active:
+            return False
+        self.active = state
+        return state
+
+
+class Threshold(Condition):
+    """Value above (or below) a level, re-armed when the value is back below (above) the clear level"""
+
+    def __init__(self, key, above=None, below=None, clear=None, name=None):
+        """
+        :param above: Fire when the value is > above
+        :param below: Fire when the value is < below
+        :param clear: Clear level (hysteresis), default: the trigger level
+        """
+        super().__init__(key, name)
+        if (above is None) == (below is None):
+            raise AttributeError("Expected either above or below")
+        self.above = above
+        self.below = below
+        self.clear = clear if clear is not None else (above if above is not None else below)
+
+    def evaluate(self, value, sample):
+        if self.above is not None:
+            if value > self.above:
+                return True
+            if value <= self.clear:
+                return False
+        else:
+            if value < self.below:
+                return True
+            if value >= self.clear:
+                return False
+        return None
+
+
+class RateOfChange(Condition):
+    """Absolute change per second between consecutive samples above a rate"""
+
+    def __init__(self, key, rate, clear=None, name=None):
+        """
+        :param rate: Fire when |change| / seconds > rate
+        :param clear: Clear rate (hysteresis), default: rate
+        """
+        super().__init__(key, name)
+        self.rate = rate
+        self.clear = clear if clear is not None else rate
+        self.previous = None  # (time, value)
+
+    def evaluate(self, value, sample):
+        now = sample["deadline"] + sample["lateness"]
+        previous, self.previous = self.previous, (now, value)
+        if previous is None or now <= previous[0]:
+            return None
+        rate = abs(value - previous[1]) / (now - previous[0])
+        if rate > self.rate:
+            return True
+        if rate <= self.clear:
+            return False
+        return None
+
+
+class CountInWindow(Condition):
+    """Number of samples matching a predicate within the last ``window`` seconds reaches a count"""
+
+    def __init__(self, key, predicate, count, window, clear=None, name=None):
+        """
+        :param predicate: Callable value -> bool, e.g. lambda errors: errors > 0
+        :param count: Fire when at least count samples in the window match
+        :param window: Window length in seconds
+        :param clear: Clear when less than clear samples match (hysteresis), default: count
+        """
+        super().__init__(key, name)
+        self.predicate = predicate
+        self.count = count
+        self.window = window
+        self.clear = clear if clear is not None else count
+        self.matches = collections.deque()  # sample times of the matching samples
+
+    def evaluate(self, value, sample):
+        now = sample["deadline"] + sample["lateness"]
+        if self.predicate(value):
+            self.matches.append(now)
+        while self.matches and self.matches[0] <= now - self.window:
+            self.matches.popleft()
+        if len(self.matches) >= self.count:
+            return True
+        if len(self.matches) < self.clear:
+            return False
+        return None
+
+
+class Watcher:
+    """Evaluate conditions on samples and run the actions of the conditions that fire"""
+
+    def __init__(self, max_latency=None):
+        """:param max_latency: Log a warning when a reaction takes longer (s), default: the sampler period in run()"""
+        self.conditions = []  # (condition, [actions])
+        self.events = []
+        self.max_latency = max_latency
+        # condition name -> {"count", "latency_total", "latency_max"}
+        self.stats = {}
+
+    def add(self, condition, *actions):
+        """Watch a condition
+        :param actions: Callables called with the event dict when the condition fires,
+            e.g. lambda event: a.laser_toggle()
+        :return: the condition
+        """
+        self.conditions.append((condition, list(actions)))
+        self.stats[condition.name] = {"count": 0, "latency_total": 0.0, "latency_max": 0.0}
+        return condition
+
+    def process(self, sample):
+        """Evaluate one sample, run the actions of the conditions that fire
+        :return: list of events of this sample
+        """
+        # The read of the sample ended here (sampler.Sampler fields), the reaction latency is counted from it
+        read_done = sample["deadline"] + sample["lateness"] + sample["duration"]
+        events = []
+        for condition, actions in self.conditions:
+            if not condition.update(sample):
+                continue
+            event = {
+                "condition": condition.name,
+                "index": sample["index"],
+                "host_time": sample["host_time"],
+                "value": sample["values"][condition.key],
+                "errors": [],
+            }
+            for action in actions:
+                try:
+                    action(event)
+                except Exception as error:  # one failing action must not stop the others or the watch
+                    logger.exception("Action of %s failed", condition.name)
+                    event["errors"].append(f"{type(error).__name__}: {error}")
+            event["latency"] = time.monotonic() - read_done
+
+            stats = self.stats[condition.name]
+            stats["count"] += 1
+            stats["latency_total"] += event["latency"]
+            stats["latency_max"] = max(stats["latency_max"], event["latency"])
+            if self.max_latency is not None and event["latency"] > self.max_latency:
+                logger.warning("%s reaction took %.3fs (> %.3fs)", condition.name, event["latency"], self.max_latency)
+            events.append(event)
+        self.events.extend(events)
+        return events
+
+    def run(self, sampler, count=None, callback=None):
+        """Watch the samples of a sampler.Sampler
+        :param count: Number of samples, None runs until sampler.stop()
+        :param callback: Called with each sample and its events, e.g. to log the stream
+        """
+        if self.max_latency is None:
+            self.max_latency = sampler.period
+        for sample in sampler.samples(count):
+            events = self.process(sample)
+            if callback is not None:
+                callback(sample, events)
+
+    def latency_report(self):
+        """return: dict condition name -> {"count", "latency_mean", "latency_max"}"""
+        report = {}
+        for name, stats in self.stats.items():
+            report[name] = {
+                "count": stats["count"],
+                "latency_mean": stats["latency_total"] / stats["count"] if stats["count"] else None,
+                "latency_max": stats["latency_max"],
+            }
+        return report